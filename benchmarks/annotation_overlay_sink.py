@@ -0,0 +1,97 @@
+"""
+Benchmark for the to-annotation-overlay-od sink: feeds synthetic images with
+many boxes/polygons through the sink and reports the throughput.
+
+Usage: python benchmarks/annotation_overlay_sink.py [--num-images N] [--num-objects N] ...
+"""
+import argparse
+import io
+import math
+import os
+import random
+import tempfile
+import time
+
+from PIL import Image as PILImage
+
+from wai.common.adams.imaging.locateobjects import LocatedObjects, LocatedObject
+from wai.common.geometry import Polygon, Point
+from wai.annotations.domain.image import Image, ImageFormat
+from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
+from wai.annotations.imgvis.sink.annotation_overlay.component import AnnotationOverlay
+
+
+def create_objects(rnd, width, height, num_objects, num_vertices):
+    """
+    Generates random objects, polygons if num_vertices > 0 otherwise boxes.
+
+    :param rnd: the random number generator to use
+    :type rnd: random.Random
+    :param width: the width of the image
+    :type width: int
+    :param height: the height of the image
+    :type height: int
+    :param num_objects: the number of objects to generate
+    :type num_objects: int
+    :param num_vertices: the number of vertices per polygon, boxes only if <1
+    :type num_vertices: int
+    :return: the objects
+    :rtype: LocatedObjects
+    """
+    result = []
+    for _ in range(num_objects):
+        w = rnd.randint(5, width // 4)
+        h = rnd.randint(5, height // 4)
+        x = rnd.randint(0, width - w - 1)
+        y = rnd.randint(0, height - h - 1)
+        lobj = LocatedObject(x, y, w, h, type="object")
+        if num_vertices > 0:
+            points = []
+            for i in range(num_vertices):
+                angle = 2 * math.pi * i / num_vertices
+                points.append(Point(x=x + w / 2 + math.cos(angle) * w / 2, y=y + h / 2 + math.sin(angle) * h / 2))
+            lobj.set_polygon(Polygon(*points))
+        result.append(lobj)
+    return LocatedObjects(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks the to-annotation-overlay-od sink.")
+    parser.add_argument("--num-images", type=int, default=100, help="the number of images to generate")
+    parser.add_argument("--num-objects", type=int, default=1000, help="the number of objects per image")
+    parser.add_argument("--num-vertices", type=int, default=0, help="the number of vertices per polygon, boxes only if <1")
+    parser.add_argument("--width", type=int, default=1024, help="the width of the images")
+    parser.add_argument("--height", type=int, default=768, help="the height of the images")
+    parser.add_argument("--scale-to", type=str, default="", help="the --scale-to option for the sink")
+    parser.add_argument("--lod-tolerance", type=float, default=0.0, help="the --lod-tolerance option for the sink")
+    parser.add_argument("--seed", type=int, default=1, help="the seed for the random number generator")
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (args.width, args.height)).save(buffer, format="PNG")
+    data = buffer.getvalue()
+    elements = []
+    for i in range(args.num_images):
+        elements.append(ImageObjectDetectionInstance(
+            Image("image-%d.png" % i, data, ImageFormat.PNG, (args.width, args.height)),
+            create_objects(rnd, args.width, args.height, args.num_objects, args.num_vertices)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        options = ["-o", os.path.join(tmp, "overlay.png"), "--lod-tolerance", str(args.lod_tolerance)]
+        if len(args.scale_to) > 0:
+            options.extend(["-s", args.scale_to])
+        sink = AnnotationOverlay(options)
+        start = time.perf_counter()
+        for element in elements:
+            sink.consume_element(element)
+        duration = time.perf_counter() - start
+        sink.finish()
+
+    num_objects = args.num_images * args.num_objects
+    print("images: %d, objects: %d, time: %.3fs" % (args.num_images, num_objects, duration))
+    print("images/s: %.1f, objects/s: %.1f" % (args.num_images / duration, num_objects / duration))
+
+
+if __name__ == "__main__":
+    main()
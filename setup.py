@@ -42,15 +42,23 @@ setup(
     entry_points={
         "wai.annotations.plugins": [
             # ISPs
+            "add-annotation-diff-od=wai.annotations.imgvis.isp.annotation_overlay.specifier:AnnotationDiffODISPSpecifier",
             "add-annotation-overlay-ic=wai.annotations.imgvis.isp.annotation_overlay.specifier:AnnotationOverlayICISPSpecifier",
             "add-annotation-overlay-is=wai.annotations.imgvis.isp.annotation_overlay.specifier:AnnotationOverlayISISPSpecifier",
             "add-annotation-overlay-od=wai.annotations.imgvis.isp.annotation_overlay.specifier:AnnotationOverlayODISPSpecifier",
             "combine-annotations-od=wai.annotations.imgvis.isp.combine_annotations.specifier:CombineAnnotationsODISPSpecifier",
+            "reservoir-sample-ic=wai.annotations.imgvis.isp.reservoir_sample.specifier:ReservoirSampleICISPSpecifier",
+            "reservoir-sample-is=wai.annotations.imgvis.isp.reservoir_sample.specifier:ReservoirSampleISISPSpecifier",
+            "reservoir-sample-od=wai.annotations.imgvis.isp.reservoir_sample.specifier:ReservoirSampleODISPSpecifier",
             # Sinks
             "image-viewer-ic=wai.annotations.imgvis.sink.image_viewer.specifier:ImageViewerICSinkSpecifier",
             "image-viewer-is=wai.annotations.imgvis.sink.image_viewer.specifier:ImageViewerISSinkSpecifier",
             "image-viewer-od=wai.annotations.imgvis.sink.image_viewer.specifier:ImageViewerODSinkSpecifier",
             "to-annotation-overlay-od=wai.annotations.imgvis.sink.annotation_overlay.specifier:AnnotationOverlayODOutputFormatSpecifier",
+            "to-annotation-stats-od=wai.annotations.imgvis.sink.annotation_stats.specifier:AnnotationStatsODOutputFormatSpecifier",
+            "to-image-shards-ic=wai.annotations.imgvis.sink.image_shards.specifier:ImageShardsICSinkSpecifier",
+            "to-image-shards-is=wai.annotations.imgvis.sink.image_shards.specifier:ImageShardsISSinkSpecifier",
+            "to-image-shards-od=wai.annotations.imgvis.sink.image_shards.specifier:ImageShardsODSinkSpecifier",
         ]
     }
 )
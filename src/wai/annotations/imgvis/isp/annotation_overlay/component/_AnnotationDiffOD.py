@@ -0,0 +1,296 @@
+import os
+import PIL
+
+from PIL import ImageDraw
+from shapely.geometry import box
+from shapely.prepared import prep
+
+from wai.common.adams.imaging.locateobjects import LocatedObjects, LocatedObject
+from wai.common.cli.options import TypedOption, FlagOption
+from wai.annotations.core.component import ProcessorComponent
+from wai.annotations.core.stream import ThenFunction, DoneFunction
+from wai.annotations.core.util import to_polygon
+from wai.annotations.domain.image import Image
+from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
+from wai.annotations.imgvis.isp.annotation_overlay.component._batch import encode_image
+from wai.annotations.imgvis.isp.annotation_overlay.component._scaling import parse_size, downscale
+from wai.annotations.imgvis.util import find_matches, profiled, profiled_finish, scale_polygon
+
+MATCH_KEY = "match"
+IOU_KEY = "iou"
+
+MATCH_TP = "tp"
+MATCH_FP = "fp"
+MATCH_FN = "fn"
+
+
+class AnnotationDiffOD(
+    ProcessorComponent[ImageObjectDetectionInstance, ImageObjectDetectionInstance]
+):
+    """
+    Stream processor that compares predictions against ground-truth annotations
+    and draws true positives, false positives and false negatives in a single pass.
+    Consecutive elements with the same image filename form a pair: the first one
+    holds the ground truth, the second one the predictions. Objects get matched
+    via their IoU (like combine-annotations-od), one ground-truth object per
+    prediction, highest IoU first.
+    """
+
+    min_iou: float = TypedOption(
+        "--min-iou",
+        type=float,
+        default=0.5,
+        help="the minimum IoU (intersect over union) for a prediction to match a ground-truth object."
+    )
+
+    match_labels: bool = FlagOption(
+        "--match-labels",
+        help="whether the labels of prediction and ground truth must agree as well for a match."
+    )
+
+    label_key: str = TypedOption(
+        "--label-key",
+        type=str,
+        default="type",
+        help="the key in the meta-data that contains the label."
+    )
+
+    tp_color: str = TypedOption(
+        "--tp-color",
+        type=str,
+        default="0,255,0",
+        help="the RGB color triplet to use for the true positives (matched predictions)."
+    )
+
+    fp_color: str = TypedOption(
+        "--fp-color",
+        type=str,
+        default="255,0,0",
+        help="the RGB color triplet to use for the false positives (unmatched predictions)."
+    )
+
+    fn_color: str = TypedOption(
+        "--fn-color",
+        type=str,
+        default="0,0,255",
+        help="the RGB color triplet to use for the false negatives (unmatched ground truth), which get filled as well."
+    )
+
+    outline_thickness: int = TypedOption(
+        "--outline-thickness",
+        type=int,
+        default=3,
+        help="the line thickness to use for the outline."
+    )
+
+    fill_alpha: int = TypedOption(
+        "--fill-alpha",
+        type=int,
+        default=64,
+        help="the alpha value to use for filling the false negatives (0: transparent, 255: opaque)."
+    )
+
+    max_size: str = TypedOption(
+        "--max-size",
+        type=str,
+        default="",
+        help="the maximum size (WIDTH,HEIGHT) of the output images; larger images get scaled down before drawing the overlay, with the annotations getting passed on unchanged; ignored if empty."
+    )
+
+    counts_file: str = TypedOption(
+        "--counts-file",
+        type=str,
+        default="",
+        help="the TSV file to write the per-image counts of true positives, false positives and false negatives to; ignored if empty."
+    )
+
+    def _initialize(self):
+        """
+        Initializes colors etc.
+        """
+        self._tp_color = tuple([int(x) for x in self.tp_color.split(",")])
+        self._fp_color = tuple([int(x) for x in self.fp_color.split(",")])
+        self._fn_color = tuple([int(x) for x in self.fn_color.split(",")])
+        self._max_size = parse_size(self.max_size)
+        self._pending = None
+        self._counts = None
+        if len(self.counts_file) > 0:
+            dirname = os.path.dirname(self.counts_file)
+            if (len(dirname) > 0) and not os.path.exists(dirname):
+                os.makedirs(dirname)
+            self._counts = open(self.counts_file, "w")
+            self._counts.write("filename\ttp\tfp\tfn\n")
+
+    def _label(self, lobj):
+        """
+        Returns the label of the object.
+
+        :param lobj: the object to get the label for
+        :type lobj: LocatedObject
+        :return: the label, None if not present
+        :rtype: str
+        """
+        return lobj.metadata.get(self.label_key, None)
+
+    def _polygons(self, located_objects):
+        """
+        Turns the located objects into shapely polygons, using the bounding box
+        for objects without a polygon.
+
+        :param located_objects: the objects to convert
+        :type located_objects: LocatedObjects
+        :return: the list of polygons
+        :rtype: list
+        """
+        result = []
+        for lobj in located_objects:
+            if lobj.has_polygon():
+                result.append(to_polygon(lobj))
+            else:
+                rect = lobj.get_rectangle()
+                result.append(box(rect.left(), rect.top(), rect.right(), rect.bottom()))
+        return result
+
+    def _match(self, ground_truth, predictions):
+        """
+        Matches the predictions with the ground truth (one-to-one).
+
+        :param ground_truth: the ground-truth annotations
+        :type ground_truth: LocatedObjects
+        :param predictions: the predicted annotations
+        :type predictions: LocatedObjects
+        :return: the dictionary of prediction index and (ground-truth index, IoU) tuple of the matches
+        :rtype: dict
+        """
+        prepared = [prep(x) for x in self._polygons(ground_truth)]
+        candidates = [x for x in find_matches(prepared, self._polygons(predictions), self.min_iou) if (x[0] > -1) and (x[1] > -1)]
+        if self.match_labels:
+            candidates = [x for x in candidates if self._label(ground_truth[x[0]]) == self._label(predictions[x[1]])]
+        result = dict()
+        matched = set()
+        for o, n, iou in sorted(candidates, key=lambda x: x[2], reverse=True):
+            if (n in result) or (o in matched):
+                continue
+            result[n] = (o, iou)
+            matched.add(o)
+        return result
+
+    def _points(self, lobj, scale_x, scale_y):
+        """
+        Assembles the points of the polygon (or bounding box) to draw.
+
+        :param lobj: the located object to get the points for
+        :type lobj: LocatedObject
+        :param scale_x: the factor to scale the x coordinates with
+        :type scale_x: float
+        :param scale_y: the factor to scale the y coordinates with
+        :type scale_y: float
+        :return: the list of (x, y) tuples
+        :rtype: list
+        """
+        if lobj.has_polygon():
+            return [tuple(x) for x in scale_polygon(lobj.get_polygon_x(), lobj.get_polygon_y(), scale_x=scale_x, scale_y=scale_y).tolist()]
+        rect = lobj.get_rectangle()
+        left, top = rect.left() * scale_x, rect.top() * scale_y
+        right, bottom = rect.right() * scale_x, rect.bottom() * scale_y
+        return [(left, top), (right, top), (right, bottom), (left, bottom)]
+
+    def _copy(self, lobj, match, iou=None):
+        """
+        Creates a copy of the object with the match information in its meta-data.
+
+        :param lobj: the object to copy
+        :type lobj: LocatedObject
+        :param match: the type of match (tp/fp/fn)
+        :type match: str
+        :param iou: the IoU with the matching object, None if not matched
+        :type iou: float
+        :return: the copy
+        :rtype: LocatedObject
+        """
+        result = LocatedObject(lobj.x, lobj.y, lobj.width, lobj.height, **lobj.metadata)
+        result.metadata[MATCH_KEY] = match
+        if iou is not None:
+            result.metadata[IOU_KEY] = iou
+        return result
+
+    def _compare(self, ground_truth: ImageObjectDetectionInstance, predictions, then: ThenFunction[ImageObjectDetectionInstance]):
+        """
+        Compares the predictions with the ground truth, renders the differences and forwards the element.
+
+        :param ground_truth: the element with the ground truth
+        :type ground_truth: ImageObjectDetectionInstance
+        :param predictions: the element with the predictions, None if none received
+        :type predictions: ImageObjectDetectionInstance
+        :param then: the function for forwarding the element
+        :type then: ThenFunction
+        """
+        element = ground_truth if predictions is None else predictions
+        lobjs_gt = ground_truth.annotations
+        lobjs_pred = LocatedObjects() if predictions is None else predictions.annotations
+        matches = self._match(lobjs_gt, lobjs_pred)
+        matched_gt = set([x[0] for x in matches.values()])
+
+        img_pil, scale_x, scale_y = downscale(element.data.pil_image, self._max_size)
+        overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        fn_fill = self._fn_color + (self.fill_alpha,)
+
+        annotations = LocatedObjects()
+        for i, lobj in enumerate(lobjs_gt):
+            if i in matched_gt:
+                continue
+            draw.polygon(self._points(lobj, scale_x, scale_y), outline=self._fn_color, fill=fn_fill, width=self.outline_thickness)
+            annotations.append(self._copy(lobj, MATCH_FN))
+        for i, lobj in enumerate(lobjs_pred):
+            if i in matches:
+                draw.polygon(self._points(lobj, scale_x, scale_y), outline=self._tp_color, width=self.outline_thickness)
+                annotations.append(self._copy(lobj, MATCH_TP, iou=matches[i][1]))
+            else:
+                draw.polygon(self._points(lobj, scale_x, scale_y), outline=self._fp_color, width=self.outline_thickness)
+                annotations.append(self._copy(lobj, MATCH_FP))
+        img_pil.paste(overlay, (0, 0), mask=overlay)
+
+        num_tp = len(matches)
+        num_fp = len(lobjs_pred) - num_tp
+        num_fn = len(lobjs_gt) - len(matched_gt)
+        if self._counts is not None:
+            self._counts.write("%s\t%d\t%d\t%d\n" % (os.path.basename(element.data.filename), num_tp, num_fp, num_fn))
+
+        img_in = element.data
+        img_out = Image(img_in.filename, encode_image(img_pil, img_in.format.pil_format_string), img_in.format, img_pil.size)
+        then(element.__class__(img_out, annotations))
+
+    @profiled
+    def process_element(
+            self,
+            element: ImageObjectDetectionInstance,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if not hasattr(self, "_pending"):
+            self._initialize()
+
+        if self._pending is not None:
+            if self._pending.data.filename == element.data.filename:
+                self._compare(self._pending, element, then)
+                self._pending = None
+                return
+            # no predictions for the previous image
+            self._compare(self._pending, None, then)
+
+        self._pending = element
+
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_pending"):
+            if self._pending is not None:
+                self._compare(self._pending, None, then)
+                self._pending = None
+            if self._counts is not None:
+                self._counts.close()
+        done()
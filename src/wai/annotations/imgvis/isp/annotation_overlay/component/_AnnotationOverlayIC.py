@@ -1,19 +1,25 @@
-import io
+import os
 import PIL
 
+from typing import List
 from PIL import ImageDraw
 
 from wai.common.cli.options import TypedOption, FlagOption
 from wai.annotations.core.component import ProcessorComponent
 from wai.annotations.core.stream import ThenFunction, DoneFunction
-from wai.annotations.core.stream.util import RequiresNoFinalisation
 from wai.annotations.domain.image import Image
 from wai.annotations.domain.image.classification import ImageClassificationInstance
+from wai.annotations.imgvis.isp.annotation_overlay.component._batch import EncodingBatch, ScratchCanvases, encode_image
+from wai.annotations.imgvis.isp.annotation_overlay.component._cache import OverlayCache, CACHE_OPTIONS
+from wai.annotations.imgvis.isp.annotation_overlay.component._fingerprint import serialize_annotations, serialize_options, fingerprint
 from wai.annotations.imgvis.isp.annotation_overlay.component._fonts import DEFAULT_FONT_FAMILY, load_font
+from wai.annotations.imgvis.isp.annotation_overlay.component._output import DIRECT_DRAW_MODES, OUTPUT_MODES, OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG, OUTPUT_MODE_LAYER_SVG, layer_filename
+from wai.annotations.imgvis.isp.annotation_overlay.component._pyramid import parse_pyramid_sizes, write_pyramid
+from wai.annotations.imgvis.isp.annotation_overlay.component._svg import svg_document, svg_rect, svg_text
+from wai.annotations.imgvis.util import profiled, profiled_finish
 
 
 class AnnotationOverlayIC(
-    RequiresNoFinalisation,
     ProcessorComponent[ImageClassificationInstance, ImageClassificationInstance]
 ):
     """
@@ -67,6 +73,61 @@ class AnnotationOverlayIC(
         help="the margin in pixels around the background."
     )
 
+    output_mode: str = TypedOption(
+        "--output-mode",
+        type=str,
+        default=OUTPUT_MODE_IMAGE,
+        choices=OUTPUT_MODES,
+        help="what to generate: %s draws the label onto the image, %s/%s only write the overlay layer as PNG/SVG to the output directory and forward the element unchanged." % (OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG, OUTPUT_MODE_LAYER_SVG)
+    )
+
+    output_dir: str = TypedOption(
+        "--output-dir",
+        type=str,
+        default=".",
+        help="the directory to write the overlay layers or pyramid levels to."
+    )
+
+    pyramid_sizes: List[str] = TypedOption(
+        "--pyramid-sizes",
+        type=str,
+        nargs="+",
+        help="the maximum sizes (WIDTH,HEIGHT) of downsampled versions of the output images to write to the output directory as well, with the size as suffix (e.g., image-320x320.jpg); the levels get derived from the rendered image by progressive halving, each one reusing the previous level; image mode only"
+    )
+
+    cache_dir: str = TypedOption(
+        "--cache-dir",
+        type=str,
+        default="",
+        help="the directory for caching the generated images between runs, keyed by image, annotations and options; ignored if empty."
+    )
+
+    cache_max_size: int = TypedOption(
+        "--cache-max-size",
+        type=int,
+        default=1024,
+        help="the maximum size of the cache in MB, the least recently used images get removed first."
+    )
+
+    reuse_overlay: bool = FlagOption(
+        "--reuse-overlay",
+        help="whether to reuse the rendered overlay of the previous image if annotations and image size are the same (e.g., consecutive video frames), only compositing it."
+    )
+
+    batch_size: int = TypedOption(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="the number of images to buffer: they get rendered using reused canvases and encoded in parallel, before getting forwarded in order; <2 to turn off."
+    )
+
+    num_workers: int = TypedOption(
+        "--num-workers",
+        type=int,
+        default=2,
+        help="the number of threads to use for encoding the images in batch mode."
+    )
+
     def _initialize(self):
         """
         Initializes colors etc.
@@ -76,7 +137,192 @@ class AnnotationOverlayIC(
         self._font_color = tuple([int(x) for x in self.font_color.split(",")])
         self._background_color = tuple([int(x) for x in self.background_color.split(",")])
         self._text_x, self._text_y = [int(x) for x in self.text_placement.upper().split(",")]
+        self._reuse_key = None
+        self._reuse_overlay = None
+        self._batch = None
+        self._scratch = None
+        if self.batch_size > 1:
+            self._batch = EncodingBatch(self.batch_size, self.num_workers)
+            self._scratch = ScratchCanvases()
+        self._cache = None
+        if len(self.cache_dir) > 0:
+            self._cache = OverlayCache(self.cache_dir, self.cache_max_size * 1024 * 1024)
+            self._cache_options = serialize_options(self, exclude=CACHE_OPTIONS)
+        self._pyramid = parse_pyramid_sizes(self.pyramid_sizes)
+        if ((self.output_mode != OUTPUT_MODE_IMAGE) or (self._pyramid is not None)) and not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+
+    def _text_size(self, draw, text):
+        """
+        Determines the size of the text.
+
+        :param draw: the ImageDraw instance
+        :type draw: ImageDraw
+        :param text: the text to output
+        :type text: str
+        :return: the w, h tuple
+        :rtype: tuple
+        """
+        try:
+            w, h = draw.textsize(text, font=self._font)
+        except:
+            # newer versions of Pillow deprecated ImageDraw.textsize
+            # https://levelup.gitconnected.com/how-to-properly-calculate-text-size-in-pil-images-17a2cc6f51fd
+            ascent, descent = self._font.getmetrics()
+            w = self._font.getmask(text).getbbox()[2]
+            h = self._font.getmask(text).getbbox()[3] + descent
+        return w, h
+
+    def _background_rect(self, draw, label):
+        """
+        Determines the rectangle of the background for the label.
+
+        :param draw: the ImageDraw instance to use for measuring the text
+        :type draw: ImageDraw
+        :param label: the label to output
+        :type label: str
+        :return: the (x0, y0, x1, y1) tuple
+        :rtype: tuple
+        """
+        w, h = self._text_size(draw, label)
+        return (
+            self._text_x - self.background_margin,
+            self._text_y - self.background_margin,
+            self._text_x + w + self.background_margin*2,
+            self._text_y + h + self.background_margin*2
+        )
+
+    def _draw_label(self, draw, label):
+        """
+        Draws the label (and background).
+
+        :param draw: the ImageDraw instance to draw with
+        :type draw: ImageDraw
+        :param label: the label to output
+        :type label: str
+        """
+        # background?
+        if self.fill_background:
+            draw.rectangle(self._background_rect(draw, label), fill=self._background_color)
 
+        # label
+        draw.text((self._text_x, self._text_y), label, font=self._font, fill=self._font_color)
+
+    def _write_layer_png(self, element: ImageClassificationInstance):
+        """
+        Writes only the overlay layer as PNG to the output directory.
+
+        :param element: the element to generate the layer for
+        :type element: ImageClassificationInstance
+        """
+        overlay = PIL.Image.new('RGBA', element.data.size, (0, 0, 0, 0))
+        self._draw_label(ImageDraw.Draw(overlay), element.annotations.label)
+        overlay.save(layer_filename(self.output_dir, element.data.filename, ".png"), format="PNG")
+
+    def _write_layer_svg(self, element: ImageClassificationInstance):
+        """
+        Writes only the overlay layer as SVG to the output directory.
+
+        :param element: the element to generate the layer for
+        :type element: ImageClassificationInstance
+        """
+        label = element.annotations.label
+        elements = []
+        if self.fill_background:
+            draw = ImageDraw.Draw(PIL.Image.new('RGBA', (1, 1), (0, 0, 0, 0)))
+            x0, y0, x1, y1 = self._background_rect(draw, label)
+            elements.append(svg_rect(x0, y0, x1 - x0, y1 - y0, self._background_color))
+        elements.append(svg_text(self._text_x, self._text_y, label, self._font_color, self.font_family, self.font_size))
+        width, height = element.data.size
+        with open(layer_filename(self.output_dir, element.data.filename, ".svg"), "w") as fp:
+            fp.write(svg_document(width, height, elements))
+
+    def _write_pyramid(self, img, img_pil=None):
+        """
+        Writes the pyramid levels of the output image to the output directory, if enabled.
+
+        :param img: the output image
+        :type img: Image
+        :param img_pil: the rendered image, None to decode the output image
+        :type img_pil: PIL.Image.Image
+        """
+        if self._pyramid is None:
+            return
+        if img_pil is None:
+            img_pil = img.pil_image
+        write_pyramid(img_pil, self._pyramid, self.output_dir, img.filename, img.format.pil_format_string)
+
+    def _render(self, element: ImageClassificationInstance):
+        """
+        Renders the overlay onto the image (or retrieves the output from the cache).
+
+        :param element: the element to render
+        :type element: ImageClassificationInstance
+        :return: the tuple of output element (if cached or unchanged, otherwise None), the rendered image and the cache key (None if not caching)
+        :rtype: tuple
+        """
+        img_in = element.data
+
+        # cached?
+        cache_key = None
+        if self._cache is not None:
+            cache_key = fingerprint(img_in.data, serialize_annotations(element.annotations), self._cache_options)
+            data = self._cache.get(cache_key)
+            if data is not None:
+                output = element.__class__(Image(img_in.filename, data, img_in.format), element.annotations)
+                self._write_pyramid(output.data)
+                return output, None, None
+
+        img_pil = element.data.pil_image
+
+        # same label and size as previous image?
+        overlay = None
+        reuse_key = None
+        if self.reuse_overlay:
+            reuse_key = fingerprint(serialize_annotations(element.annotations), repr(img_pil.size).encode())
+            if reuse_key == self._reuse_key:
+                overlay = self._reuse_overlay
+
+        # text and background are opaque, i.e., can be drawn onto the image directly
+        if (overlay is None) and (img_pil.mode in DIRECT_DRAW_MODES) and not self.reuse_overlay:
+            self._draw_label(ImageDraw.Draw(img_pil), element.annotations.label)
+        else:
+            if overlay is None:
+                if (self._scratch is not None) and not self.reuse_overlay:
+                    overlay = self._scratch.get(img_pil.size)
+                else:
+                    overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
+                draw = ImageDraw.Draw(overlay)
+                self._draw_label(draw, element.annotations.label)
+                if reuse_key is not None:
+                    self._reuse_key = reuse_key
+                    self._reuse_overlay = overlay
+            img_pil.paste(overlay, (0, 0), mask=overlay)
+
+        return None, img_pil, cache_key
+
+    def _finalize(self, element: ImageClassificationInstance, img_pil, cache_key, data):
+        """
+        Generates the output element from the encoded image, caching it if necessary.
+
+        :param element: the element that got rendered
+        :type element: ImageClassificationInstance
+        :param img_pil: the rendered image
+        :type img_pil: PIL.Image.Image
+        :param cache_key: the key to cache the image under, None if not caching
+        :type cache_key: str
+        :param data: the encoded image
+        :type data: bytes
+        :return: the new element
+        :rtype: ImageClassificationInstance
+        """
+        if cache_key is not None:
+            self._cache.put(cache_key, data)
+        img_out = Image(element.data.filename, data, element.data.format, img_pil.size)
+        self._write_pyramid(img_out, img_pil=img_pil)
+        return element.__class__(img_out, element.annotations)
+
+    @profiled
     def process_element(
             self,
             element: ImageClassificationInstance,
@@ -86,33 +332,32 @@ class AnnotationOverlayIC(
         if not hasattr(self, "_colors"):
             self._initialize()
 
-        img_in = element.data
-        img_pil = element.data.pil_image
-
-        overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
+        if self.output_mode == OUTPUT_MODE_LAYER_PNG:
+            self._write_layer_png(element)
+            then(element)
+            return
+        elif self.output_mode == OUTPUT_MODE_LAYER_SVG:
+            self._write_layer_svg(element)
+            then(element)
+            return
 
-        # background?
-        if self.fill_background:
-            w, h = draw.textsize(element.annotations.label, font=self._font)
-            draw.rectangle(
-                (
-                    self._text_x - self.background_margin,
-                    self._text_y - self.background_margin,
-                    self._text_x + w + self.background_margin*2,
-                    self._text_y + h + self.background_margin*2
-                ),
-                fill=self._background_color)
-
-        # label
-        draw.text((self._text_x, self._text_y), element.annotations.label, font=self._font, fill=self._font_color)
-
-        img_pil.paste(overlay, (0, 0), mask=overlay)
+        output, img_pil, cache_key = self._render(element)
+        if self._batch is not None:
+            self._batch.add(element, output=output, img_pil=img_pil, cache_key=cache_key)
+            if self._batch.is_full():
+                self._batch.flush(self._finalize, then)
+            return
+        if output is None:
+            output = self._finalize(element, img_pil, cache_key, encode_image(img_pil, element.data.format.pil_format_string))
+        then(output)
 
-        # convert back to PIL bytes
-        pil_img_bytes = io.BytesIO()
-        img_pil.save(pil_img_bytes, format=img_in.format.pil_format_string)
-        img_out = Image(img_in.filename, pil_img_bytes.getvalue(), img_in.format, img_in.size)
-
-        # new element
-        then(element.__class__(img_out, element.annotations))
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageClassificationInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_colors") and (self._batch is not None):
+            self._batch.flush(self._finalize, then)
+            self._batch.close()
+        done()
@@ -1,5 +1,6 @@
-import io
+import os
 import PIL
+import numpy as np
 
 from typing import List
 from PIL import ImageDraw
@@ -7,14 +8,21 @@ from PIL import ImageDraw
 from wai.common.cli.options import TypedOption
 from wai.annotations.core.component import ProcessorComponent
 from wai.annotations.core.stream import ThenFunction, DoneFunction
-from wai.annotations.core.stream.util import RequiresNoFinalisation
 from wai.annotations.domain.image import Image
-from wai.annotations.domain.image.segmentation import ImageSegmentationInstance
-from wai.annotations.imgvis.isp.annotation_overlay.component._colors import default_colors
+from wai.annotations.domain.image.segmentation import ImageSegmentationInstance, ImageSegmentationAnnotation
+from wai.annotations.imgvis.isp.annotation_overlay.component._boundaries import STYLES, STYLE_FILL, STYLE_OUTLINE, boundary_mask
+from wai.annotations.imgvis.isp.annotation_overlay.component._batch import EncodingBatch, ScratchCanvases, encode_image
+from wai.annotations.imgvis.isp.annotation_overlay.component._cache import OverlayCache, CACHE_OPTIONS
+from wai.annotations.imgvis.isp.annotation_overlay.component._colors import default_colors, hash_color, COLOR_SCHEMES, COLOR_SCHEME_SEQUENTIAL, COLOR_SCHEME_HASH
+from wai.annotations.imgvis.isp.annotation_overlay.component._fingerprint import serialize_annotations, serialize_options, fingerprint
+from wai.annotations.imgvis.isp.annotation_overlay.component._output import OUTPUT_MODES_RASTER, OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG, layer_filename
+from wai.annotations.imgvis.isp.annotation_overlay.component._pyramid import parse_pyramid_sizes, write_pyramid
+from wai.annotations.imgvis.isp.annotation_overlay.component._scaling import parse_size, downscale
+from wai.annotations.imgvis.isp.annotation_overlay.component._tiles import tile_boxes, tile_filename
+from wai.annotations.imgvis.util import profiled, profiled_finish
 
 
 class AnnotationOverlayIS(
-    RequiresNoFinalisation,
     ProcessorComponent[ImageSegmentationInstance, ImageSegmentationInstance]
 ):
     """
@@ -35,6 +43,28 @@ class AnnotationOverlayIS(
         help="the alpha value to use for overlaying the annotations (0: transparent, 255: opaque)."
     )
 
+    style: str = TypedOption(
+        "--style",
+        type=str,
+        default=STYLE_FILL,
+        choices=STYLES,
+        help="how to draw the annotations: %s overlays the complete areas, %s only draws the boundaries between the labels (determined on the label index array for all labels at once)." % (STYLE_FILL, STYLE_OUTLINE)
+    )
+
+    outline_thickness: int = TypedOption(
+        "--outline-thickness",
+        type=int,
+        default=1,
+        help="the thickness in pixels of the boundaries in %s style." % STYLE_OUTLINE
+    )
+
+    outline_alpha: int = TypedOption(
+        "--outline-alpha",
+        type=int,
+        default=255,
+        help="the alpha value to use for the boundaries in %s style (0: transparent, 255: opaque)." % STYLE_OUTLINE
+    )
+
     colors: List[str] = TypedOption(
         "--colors",
         type=str,
@@ -42,6 +72,85 @@ class AnnotationOverlayIS(
         help="the RGB triplets (R,G,B) of custom colors to use, uses default colors if not supplied"
     )
 
+    color_scheme: str = TypedOption(
+        "--color-scheme",
+        type=str,
+        default=COLOR_SCHEME_SEQUENTIAL,
+        choices=COLOR_SCHEMES,
+        help="how to assign colors to labels: %s assigns them in order of appearance, %s uses a stable hash of the label, which makes the colors independent of the order of the stream" % (COLOR_SCHEME_SEQUENTIAL, COLOR_SCHEME_HASH)
+    )
+
+    label_order: List[str] = TypedOption(
+        "--label-order",
+        type=str,
+        nargs="+",
+        help="the pre-declared list of labels, the position of a label determines its (custom) color regardless of the order of the stream"
+    )
+
+    max_size: str = TypedOption(
+        "--max-size",
+        type=str,
+        default="",
+        help="the maximum size (WIDTH,HEIGHT) of the output images; larger images get scaled down before drawing the overlay, with the annotations getting scaled down as well (nearest neighbour), since image and segmentation annotations must have the same size; ignored if empty or in tiled mode."
+    )
+
+    tile_size: int = TypedOption(
+        "--tile-size",
+        type=int,
+        default=0,
+        help="the size in pixels of the square tiles to render the image in, limiting the size of the overlay to a single tile (only the overlay is tiled, the image itself still gets decoded in full); the tiles get written as PNG files to the output directory and the element gets forwarded unchanged; <1 to turn off."
+    )
+
+    output_mode: str = TypedOption(
+        "--output-mode",
+        type=str,
+        default=OUTPUT_MODE_IMAGE,
+        choices=OUTPUT_MODES_RASTER,
+        help="what to generate: %s draws the overlay onto the image, %s only writes the overlay layer as PNG to the output directory and forwards the element unchanged." % (OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG)
+    )
+
+    output_dir: str = TypedOption(
+        "--output-dir",
+        type=str,
+        default=".",
+        help="the directory to write the tiles, overlay layers or pyramid levels to."
+    )
+
+    pyramid_sizes: List[str] = TypedOption(
+        "--pyramid-sizes",
+        type=str,
+        nargs="+",
+        help="the maximum sizes (WIDTH,HEIGHT) of downsampled versions of the output images to write to the output directory as well, with the size as suffix (e.g., image-320x320.jpg); the levels get derived from the rendered image by progressive halving, each one reusing the previous level; image mode only"
+    )
+
+    cache_dir: str = TypedOption(
+        "--cache-dir",
+        type=str,
+        default="",
+        help="the directory for caching the generated images between runs, keyed by image, annotations, label colors and options; ignored if empty."
+    )
+
+    cache_max_size: int = TypedOption(
+        "--cache-max-size",
+        type=int,
+        default=1024,
+        help="the maximum size of the cache in MB, the least recently used images get removed first."
+    )
+
+    batch_size: int = TypedOption(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="the number of images to buffer: they get rendered using reused canvases and encoded in parallel, before getting forwarded in order; <2 to turn off."
+    )
+
+    num_workers: int = TypedOption(
+        "--num-workers",
+        type=int,
+        default=2,
+        help="the number of threads to use for encoding the images in batch mode."
+    )
+
     def _initialize(self):
         """
         Initializes colors etc.
@@ -53,9 +162,26 @@ class AnnotationOverlayIS(
         if self.colors is not None:
             for color in self.colors:
                 self._custom_colors.append([int(x) for x in color.split(",")])
+        self._label_order = dict()
+        if self.label_order is not None:
+            for index, label in enumerate(self.label_order):
+                self._label_order[label] = index
         self._accepted_labels = None
         if (self.labels is not None) and (len(self.labels) > 0):
             self._accepted_labels = set(self.labels)
+        self._max_size = parse_size(self.max_size)
+        self._cache = None
+        if len(self.cache_dir) > 0:
+            self._cache = OverlayCache(self.cache_dir, self.cache_max_size * 1024 * 1024)
+            self._cache_options = serialize_options(self, exclude=CACHE_OPTIONS)
+        self._batch = None
+        self._scratch = None
+        if self.batch_size > 1:
+            self._batch = EncodingBatch(self.batch_size, self.num_workers)
+            self._scratch = ScratchCanvases()
+        self._pyramid = parse_pyramid_sizes(self.pyramid_sizes)
+        if ((self.tile_size > 0) or (self.output_mode != OUTPUT_MODE_IMAGE) or (self._pyramid is not None)) and not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
 
     def _next_default_color(self):
         """
@@ -70,6 +196,35 @@ class AnnotationOverlayIS(
         self._default_colors_index += 1
         return result
 
+    def _determine_color(self, label):
+        """
+        Determines the color for a label that hasn't been assigned one yet.
+
+        :param label: the label to determine the color for
+        :type label: str
+        :return: the RGB color tuple
+        :rtype: tuple
+        """
+        # pre-declared labels
+        if label in self._label_order:
+            index = self._label_order[label]
+            if index < len(self._custom_colors):
+                return self._custom_colors[index]
+            return self._default_colors[index % len(self._default_colors)]
+
+        # stateless
+        if self.color_scheme == COLOR_SCHEME_HASH:
+            if len(self._custom_colors) > 0:
+                return hash_color(label, self._custom_colors)
+            return hash_color(label, self._default_colors)
+
+        # order of appearance
+        if label in self._label_mapping:
+            index = self._label_mapping[label]
+            if index < len(self._custom_colors):
+                return self._custom_colors[index]
+        return self._next_default_color()
+
     def _get_color(self, label):
         """
         Returns the color for the label.
@@ -80,17 +235,296 @@ class AnnotationOverlayIS(
         :rtype: tuple
         """
         if label not in self._colors:
-            has_custom = False
-            if label in self._label_mapping:
-                index = self._label_mapping[label]
-                if index < len(self._custom_colors):
-                    has_custom = True
-                    self._colors[label] = self._custom_colors[index]
-            if not has_custom:
-                self._colors[label] = self._next_default_color()
+            self._colors[label] = self._determine_color(label)
         r, g, b = self._colors[label]
         return r, g, b, self.alpha
 
+    def _register_colors(self, annotations):
+        """
+        Determines the colors of the labels present in the image, in the order
+        of the labels, so that the sequential color scheme doesn't depend on the
+        order of drawing (e.g., tile by tile) or on cache hits.
+
+        :param annotations: the segmentation annotations
+        :type annotations: ImageSegmentationAnnotation
+        :return: the list of (label, RGBA color) tuples
+        :rtype: list
+        """
+        result = []
+        labels = annotations.labels
+        present = np.bincount(annotations.indices.ravel(), minlength=len(labels) + 1)
+        for label_index in np.flatnonzero(present[1:]):
+            label = labels[label_index]
+            if (self._accepted_labels is None) or (label in self._accepted_labels):
+                result.append((label, self._get_color(label)))
+        return result
+
+    def _scaled_indices(self, annotations, size):
+        """
+        Scales the label index array (nearest neighbour) to the specified size.
+
+        :param annotations: the segmentation annotations
+        :type annotations: ImageSegmentationAnnotation
+        :param size: the (width, height) to scale to
+        :type size: tuple
+        :return: the scaled index array
+        :rtype: np.ndarray
+        """
+        return np.asarray(PIL.Image.fromarray(annotations.indices).resize(size, PIL.Image.NEAREST))
+
+    def _output_annotations(self, annotations, size):
+        """
+        Returns the annotations to forward with an output image of the specified
+        size, scaling them down if necessary (nearest neighbour).
+
+        :param annotations: the segmentation annotations
+        :type annotations: ImageSegmentationAnnotation
+        :param size: the (width, height) of the output image
+        :type size: tuple
+        :return: the annotations of the output size
+        :rtype: ImageSegmentationAnnotation
+        """
+        if tuple(annotations.size) == tuple(size):
+            return annotations
+        result = ImageSegmentationAnnotation(annotations.labels, size)
+        result.indices = self._scaled_indices(annotations, size).astype(np.uint16)
+        return result
+
+    def _scaled_label_images(self, annotations, size):
+        """
+        Generates the label images at the specified size, by scaling the
+        label index array (nearest neighbour) rather than the individual layers.
+
+        :param annotations: the segmentation annotations
+        :type annotations: ImageSegmentationAnnotation
+        :param size: the (width, height) to scale to
+        :type size: tuple
+        :return: the dictionary with the layers, key is name of layer
+        :rtype: dict
+        """
+        result = dict()
+        indices = self._scaled_indices(annotations, size)
+        labels = annotations.labels
+        for label_index in np.unique(indices):
+            if label_index == 0:
+                continue
+            result[labels[label_index - 1]] = PIL.Image.fromarray(indices == label_index)
+        return result
+
+    def _fill_overlay(self, indices, labels):
+        """
+        Generates the overlay with the areas of the labels.
+
+        :param indices: the 2D array of label indices
+        :type indices: np.ndarray
+        :param labels: the labels corresponding to the indices (1-based)
+        :type labels: list
+        :return: the RGBA overlay, None if nothing to draw
+        :rtype: PIL.Image.Image
+        """
+        overlay = None
+        for label_index in np.unique(indices):
+            # background or skip label?
+            if label_index == 0:
+                continue
+            label = labels[label_index - 1]
+            if (self._accepted_labels is not None) and (label not in self._accepted_labels):
+                continue
+            # draw overlay
+            if overlay is None:
+                overlay = PIL.Image.new('RGBA', (indices.shape[1], indices.shape[0]), (0, 0, 0, 0))
+                draw = ImageDraw.Draw(overlay)
+            mask = PIL.Image.fromarray(indices == label_index)
+            draw.bitmap((0, 0), mask, fill=self._get_color(label))
+        return overlay
+
+    def _outline_overlay(self, indices, labels, margin=(0, 0, 0, 0)):
+        """
+        Generates the overlay with the boundaries of the labels in a single pass,
+        by mapping the label indices of the boundary pixels to their colors.
+
+        :param indices: the 2D array of label indices
+        :type indices: np.ndarray
+        :param labels: the labels corresponding to the indices (1-based)
+        :type labels: list
+        :param margin: the (left, top, right, bottom) margin in pixels around the area of interest
+                       in the index array, which only gets used for determining the boundaries
+        :type margin: tuple
+        :return: the RGBA overlay of the area of interest, None if nothing to draw
+        :rtype: PIL.Image.Image
+        """
+        mask = boundary_mask(indices, self.outline_thickness)
+        left, top, right, bottom = margin
+        indices = indices[top:indices.shape[0] - bottom, left:indices.shape[1] - right]
+        mask = mask[top:mask.shape[0] - bottom, left:mask.shape[1] - right]
+        colors = np.zeros((len(labels) + 1, 4), dtype=np.uint8)
+        updated = False
+        for label_index in np.unique(indices[mask]):
+            # skip label?
+            label = labels[label_index - 1]
+            if (self._accepted_labels is not None) and (label not in self._accepted_labels):
+                continue
+            updated = True
+            colors[label_index] = tuple(self._get_color(label)[:3]) + (self.outline_alpha,)
+        if not updated:
+            return None
+        return PIL.Image.fromarray(colors[np.where(mask, indices, 0)])
+
+    def _process_tiled(self, element: ImageSegmentationInstance):
+        """
+        Renders the image tile by tile and writes the tiles to the output directory.
+        The masks only get generated for the area of the current tile.
+
+        :param element: the element to render
+        :type element: ImageSegmentationInstance
+        """
+        img_pil = element.data.pil_image
+        width, height = img_pil.size
+        labels = element.annotations.labels
+        indices = element.annotations.indices
+        self._register_colors(element.annotations)
+
+        for row, col, box in tile_boxes(width, height, self.tile_size):
+            tile = img_pil.crop(box)
+            if self.style == STYLE_OUTLINE:
+                # the boundaries depend on the pixels around the tile as well
+                t = self.outline_thickness
+                margin = (min(t, box[0]), min(t, box[1]), min(t, width - box[2]), min(t, height - box[3]))
+                overlay = self._outline_overlay(
+                    indices[box[1] - margin[1]:box[3] + margin[3], box[0] - margin[0]:box[2] + margin[2]],
+                    labels, margin=margin)
+            else:
+                overlay = self._fill_overlay(indices[box[1]:box[3], box[0]:box[2]], labels)
+            if overlay is not None:
+                tile.paste(overlay, (0, 0), mask=overlay)
+            tile.save(tile_filename(self.output_dir, element.data.filename, row, col), format="PNG")
+
+    def _write_layer_png(self, element: ImageSegmentationInstance):
+        """
+        Writes only the overlay layer (at the original resolution) as PNG to the output directory.
+
+        :param element: the element to generate the layer for
+        :type element: ImageSegmentationInstance
+        """
+        self._register_colors(element.annotations)
+        if self.style == STYLE_OUTLINE:
+            overlay = self._outline_overlay(element.annotations.indices, element.annotations.labels)
+            if overlay is None:
+                overlay = PIL.Image.new('RGBA', element.annotations.size, (0, 0, 0, 0))
+        else:
+            overlay = PIL.Image.new('RGBA', element.annotations.size, (0, 0, 0, 0))
+            draw = ImageDraw.Draw(overlay)
+            label_images = element.annotations.label_images
+            for label in label_images:
+                if (self._accepted_labels is not None) and (label not in self._accepted_labels):
+                    continue
+                draw.bitmap((0, 0), label_images[label], fill=self._get_color(label))
+        overlay.save(layer_filename(self.output_dir, element.data.filename, ".png"), format="PNG")
+
+    def _write_pyramid(self, img, img_pil=None):
+        """
+        Writes the pyramid levels of the output image to the output directory, if enabled.
+
+        :param img: the output image
+        :type img: Image
+        :param img_pil: the rendered image, None to decode the output image
+        :type img_pil: PIL.Image.Image
+        """
+        if self._pyramid is None:
+            return
+        if img_pil is None:
+            img_pil = img.pil_image
+        write_pyramid(img_pil, self._pyramid, self.output_dir, img.filename, img.format.pil_format_string)
+
+    def _render(self, element: ImageSegmentationInstance):
+        """
+        Renders the overlay onto the image (or retrieves the output from the cache).
+
+        :param element: the element to render
+        :type element: ImageSegmentationInstance
+        :return: the tuple of output element (if cached or unchanged, otherwise None), the rendered image and the cache key (None if not caching)
+        :rtype: tuple
+        """
+        img_in = element.data
+        colors = self._register_colors(element.annotations)
+
+        # cached? (the colors depend on the previous images with the sequential color scheme)
+        cache_key = None
+        if self._cache is not None:
+            cache_key = fingerprint(img_in.data, serialize_annotations(element.annotations), self._cache_options, repr(colors).encode())
+            data = self._cache.get(cache_key)
+            if data is not None:
+                img_out = Image(img_in.filename, data, img_in.format)
+                output = element.__class__(img_out, self._output_annotations(element.annotations, img_out.size))
+                self._write_pyramid(output.data)
+                return output, None, None
+
+        img_pil, scale_x, scale_y = downscale(element.data.pil_image, self._max_size)
+        scaled = (scale_x != 1.0) or (scale_y != 1.0)
+
+        if self.style == STYLE_OUTLINE:
+            # boundaries of all labels at once
+            if scaled:
+                indices = self._scaled_indices(element.annotations, img_pil.size)
+            else:
+                indices = element.annotations.indices
+            overlay = self._outline_overlay(indices, element.annotations.labels)
+            updated = overlay is not None
+        else:
+            # create overlay for annotations
+            if self._scratch is not None:
+                overlay = self._scratch.get(img_pil.size)
+            else:
+                overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
+            draw = ImageDraw.Draw(overlay)
+
+            if scaled:
+                label_images = self._scaled_label_images(element.annotations, img_pil.size)
+            else:
+                label_images = element.annotations.label_images
+            updated = False
+            for label in label_images:
+                # skip label?
+                if (self._accepted_labels is not None) and (label not in self._accepted_labels):
+                    continue
+                # draw overlay
+                updated = True
+                mask = label_images[label]
+                draw.bitmap((0, 0), mask, fill=self._get_color(label))
+
+        if updated or scaled:
+            # add overlay
+            if updated:
+                img_pil.paste(overlay, (0, 0), mask=overlay)
+            return None, img_pil, cache_key
+        else:
+            if cache_key is not None:
+                self._cache.put(cache_key, img_in.data)
+            self._write_pyramid(img_in, img_pil=img_pil)
+            return element, None, None
+
+    def _finalize(self, element: ImageSegmentationInstance, img_pil, cache_key, data):
+        """
+        Generates the output element from the encoded image, caching it if necessary.
+
+        :param element: the element that got rendered
+        :type element: ImageSegmentationInstance
+        :param img_pil: the rendered image
+        :type img_pil: PIL.Image.Image
+        :param cache_key: the key to cache the image under, None if not caching
+        :type cache_key: str
+        :param data: the encoded image
+        :type data: bytes
+        :return: the new element
+        :rtype: ImageSegmentationInstance
+        """
+        if cache_key is not None:
+            self._cache.put(cache_key, data)
+        img_out = Image(element.data.filename, data, element.data.format, img_pil.size)
+        self._write_pyramid(img_out, img_pil=img_pil)
+        return element.__class__(img_out, self._output_annotations(element.annotations, img_pil.size))
+
+    @profiled
     def process_element(
             self,
             element: ImageSegmentationInstance,
@@ -100,38 +534,38 @@ class AnnotationOverlayIS(
         if not hasattr(self, "_colors"):
             self._initialize()
 
-        img_in = element.data
-        img_pil = element.data.pil_image
-
         # create label/index mapping for custom colors
         self._label_mapping = dict()
         for index, label in enumerate(element.annotations.labels):
             self._label_mapping[label] = index
 
-        # create overlay for annotations
-        overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-
-        label_images = element.annotations.label_images
-        updated = False
-        for label in label_images:
-            # skip label?
-            if (self._accepted_labels is not None) and (label not in self._accepted_labels):
-                continue
-            # draw overlay
-            updated = True
-            mask = label_images[label]
-            draw.bitmap((0, 0), mask, fill=self._get_color(label))
+        if self.tile_size > 0:
+            self._process_tiled(element)
+            then(element)
+            return
 
-        if updated:
-            # add overlay
-            img_pil.paste(overlay, (0, 0), mask=overlay)
-            # convert back to PIL bytes
-            pil_img_bytes = io.BytesIO()
-            img_pil.save(pil_img_bytes, format=img_in.format.pil_format_string)
-            img_out = Image(img_in.filename, pil_img_bytes.getvalue(), img_in.format, img_in.size)
-
-            # new element
-            then(element.__class__(img_out, element.annotations))
-        else:
+        if self.output_mode == OUTPUT_MODE_LAYER_PNG:
+            self._write_layer_png(element)
             then(element)
+            return
+
+        output, img_pil, cache_key = self._render(element)
+        if self._batch is not None:
+            self._batch.add(element, output=output, img_pil=img_pil, cache_key=cache_key)
+            if self._batch.is_full():
+                self._batch.flush(self._finalize, then)
+            return
+        if output is None:
+            output = self._finalize(element, img_pil, cache_key, encode_image(img_pil, element.data.format.pil_format_string))
+        then(output)
+
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageSegmentationInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_colors") and (self._batch is not None):
+            self._batch.flush(self._finalize, then)
+            self._batch.close()
+        done()
@@ -1,4 +1,4 @@
-import io
+import os
 import PIL
 
 from typing import List
@@ -7,15 +7,30 @@ from PIL import ImageDraw
 from wai.common.cli.options import TypedOption, FlagOption
 from wai.annotations.core.component import ProcessorComponent
 from wai.annotations.core.stream import ThenFunction, DoneFunction
-from wai.annotations.core.stream.util import RequiresNoFinalisation
 from wai.annotations.domain.image import Image
 from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
-from wai.annotations.imgvis.isp.annotation_overlay.component._colors import default_colors, text_color
+from wai.annotations.imgvis.isp.annotation_overlay.component._batch import EncodingBatch, ScratchCanvases, encode_image
+from wai.annotations.imgvis.isp.annotation_overlay.component._cache import OverlayCache, CACHE_OPTIONS
+from wai.annotations.imgvis.isp.annotation_overlay.component._colors import default_colors, hash_color, COLOR_SCHEMES, COLOR_SCHEME_SEQUENTIAL, COLOR_SCHEME_HASH, text_color
+from wai.annotations.imgvis.isp.annotation_overlay.component._filter import compile_filter, top_k
+from wai.annotations.imgvis.isp.annotation_overlay.component._fingerprint import serialize_annotations, serialize_options, fingerprint
 from wai.annotations.imgvis.isp.annotation_overlay.component._fonts import DEFAULT_FONT_FAMILY, load_font
+from wai.annotations.imgvis.isp.annotation_overlay.component._output import DIRECT_DRAW_MODES, OUTPUT_MODES, OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG, OUTPUT_MODE_LAYER_SVG, layer_filename
+from wai.annotations.imgvis.isp.annotation_overlay.component._pyramid import parse_pyramid_sizes, write_pyramid
+from wai.annotations.imgvis.isp.annotation_overlay.component._scaling import parse_size, downscale
+from wai.annotations.imgvis.isp.annotation_overlay.component._spatial import GridIndex
+from wai.annotations.imgvis.isp.annotation_overlay.component._svg import svg_document, svg_polygon, svg_rect, svg_text
+from wai.annotations.imgvis.isp.annotation_overlay.component._tiles import tile_boxes, tile_filename
+from wai.annotations.imgvis.util import profiled, profiled_finish, scale_polygon
+
+
+TEXT_PLACEMENT_AUTO = "auto"
+
+# the number of characters to keep when abbreviating labels
+ABBREVIATION_LENGTH = 3
 
 
 class AnnotationOverlayOD(
-    RequiresNoFinalisation,
     ProcessorComponent[ImageObjectDetectionInstance, ImageObjectDetectionInstance]
 ):
     """
@@ -36,6 +51,27 @@ class AnnotationOverlayOD(
         help="the key in the meta-data that contains the label."
     )
 
+    filter: str = TypedOption(
+        "--filter",
+        type=str,
+        default="",
+        help="the expression that objects must satisfy to get drawn, using the meta-data keys as variables (numeric strings get compared as numbers), e.g.: score >= 0.5 and type in {car,truck}; supports comparisons, and/or/not, arithmetic and literals; ignored if empty."
+    )
+
+    top_k: int = TypedOption(
+        "--top-k",
+        type=int,
+        default=0,
+        help="the maximum number of objects to draw per image (after applying the labels and the filter), keeping the ones with the largest values for the top-k key; <1 to draw all."
+    )
+
+    top_k_key: str = TypedOption(
+        "--top-k-key",
+        type=str,
+        default="score",
+        help="the numeric meta-data key for ranking the objects when using top-k, objects without a value rank last."
+    )
+
     text_format: str = TypedOption(
         "--text-format",
         type=str,
@@ -47,7 +83,8 @@ class AnnotationOverlayOD(
         "--text-placement",
         type=str,
         default="T,L",
-        help="comma-separated list of vertical (T=top, C=center, B=bottom) and horizontal (L=left, C=center, R=right) anchoring."
+        help="comma-separated list of vertical (T=top, C=center, B=bottom) and horizontal (L=left, C=center, R=right) anchoring; "
+             "'%s' places each label at the first position around/inside its object that doesn't overlap already placed labels, abbreviating or dropping labels that don't fit anywhere." % TEXT_PLACEMENT_AUTO
     )
 
     font_family: str = TypedOption(
@@ -78,6 +115,21 @@ class AnnotationOverlayOD(
         help="the RGB triplets (R,G,B) of custom colors to use, uses default colors if not supplied"
     )
 
+    color_scheme: str = TypedOption(
+        "--color-scheme",
+        type=str,
+        default=COLOR_SCHEME_SEQUENTIAL,
+        choices=COLOR_SCHEMES,
+        help="how to assign colors to labels: %s assigns them in order of appearance, %s uses a stable hash of the label, which makes the colors independent of the order of the stream" % (COLOR_SCHEME_SEQUENTIAL, COLOR_SCHEME_HASH)
+    )
+
+    label_order: List[str] = TypedOption(
+        "--label-order",
+        type=str,
+        nargs="+",
+        help="the pre-declared list of labels, the position of a label determines its (custom) color regardless of the order of the stream"
+    )
+
     outline_thickness: int = TypedOption(
         "--outline-thickness",
         type=int,
@@ -114,6 +166,82 @@ class AnnotationOverlayOD(
         help="whether to force a bounding box even if there is a polygon available"
     )
 
+    lod_tolerance: float = TypedOption(
+        "--lod-tolerance",
+        type=float,
+        default=0.0,
+        help="the level-of-detail tolerance in output pixels: consecutive polygon vertices that fall into the same cell of a grid with this cell size get merged before drawing, which keeps the rendering cost of very detailed polygons in line with the visible detail; <=0 to turn off."
+    )
+
+    max_size: str = TypedOption(
+        "--max-size",
+        type=str,
+        default="",
+        help="the maximum size (WIDTH,HEIGHT) of the output images; larger images get scaled down before drawing the overlay, with the annotations getting passed on unchanged; ignored if empty or in tiled mode."
+    )
+
+    tile_size: int = TypedOption(
+        "--tile-size",
+        type=int,
+        default=0,
+        help="the size in pixels of the square tiles to render the image in, limiting the size of the overlay to a single tile (only the overlay is tiled, the image itself still gets decoded in full); the tiles get written as PNG files to the output directory and the element gets forwarded unchanged; <1 to turn off."
+    )
+
+    output_mode: str = TypedOption(
+        "--output-mode",
+        type=str,
+        default=OUTPUT_MODE_IMAGE,
+        choices=OUTPUT_MODES,
+        help="what to generate: %s draws the overlay onto the image, %s/%s only write the overlay layer as PNG/SVG to the output directory and forward the element unchanged." % (OUTPUT_MODE_IMAGE, OUTPUT_MODE_LAYER_PNG, OUTPUT_MODE_LAYER_SVG)
+    )
+
+    output_dir: str = TypedOption(
+        "--output-dir",
+        type=str,
+        default=".",
+        help="the directory to write the tiles, overlay layers or pyramid levels to."
+    )
+
+    pyramid_sizes: List[str] = TypedOption(
+        "--pyramid-sizes",
+        type=str,
+        nargs="+",
+        help="the maximum sizes (WIDTH,HEIGHT) of downsampled versions of the output images to write to the output directory as well, with the size as suffix (e.g., image-320x320.jpg); the levels get derived from the rendered image by progressive halving, each one reusing the previous level; image mode only"
+    )
+
+    cache_dir: str = TypedOption(
+        "--cache-dir",
+        type=str,
+        default="",
+        help="the directory for caching the generated images between runs, keyed by image, annotations, label colors and options; ignored if empty."
+    )
+
+    cache_max_size: int = TypedOption(
+        "--cache-max-size",
+        type=int,
+        default=1024,
+        help="the maximum size of the cache in MB, the least recently used images get removed first."
+    )
+
+    reuse_overlay: bool = FlagOption(
+        "--reuse-overlay",
+        help="whether to reuse the rendered overlay of the previous image if annotations and image size are the same (e.g., consecutive video frames), only compositing it."
+    )
+
+    batch_size: int = TypedOption(
+        "--batch-size",
+        type=int,
+        default=1,
+        help="the number of images to buffer: they get rendered using reused canvases and encoded in parallel, before getting forwarded in order; <2 to turn off."
+    )
+
+    num_workers: int = TypedOption(
+        "--num-workers",
+        type=int,
+        default=2,
+        help="the number of threads to use for encoding the images in batch mode."
+    )
+
     def _initialize(self):
         """
         Initializes colors etc.
@@ -125,12 +253,38 @@ class AnnotationOverlayOD(
         if self.colors is not None:
             for color in self.colors:
                 self._custom_colors.append([int(x) for x in color.split(",")])
+        self._label_order = dict()
+        if self.label_order is not None:
+            for index, label in enumerate(self.label_order):
+                self._label_order[label] = index
         self._label_mapping = dict()
         self._font = load_font(self.logger, self.font_family, self.font_size)
-        self._text_vertical, self._text_horizontal = self.text_placement.upper().split(",")
+        self._auto_placement = (self.text_placement.lower() == TEXT_PLACEMENT_AUTO)
+        if not self._auto_placement:
+            self._text_vertical, self._text_horizontal = self.text_placement.upper().split(",")
         self._accepted_labels = None
         if (self.labels is not None) and (len(self.labels) > 0):
             self._accepted_labels = set(self.labels)
+        self._filter = None
+        if len(self.filter.strip()) > 0:
+            self._filter = compile_filter(self.filter)
+        self._max_size = parse_size(self.max_size)
+        self._opaque = (self.outline_alpha >= 255) and not self.fill
+        self._reuse_key = None
+        self._reuse_overlay = None
+        self._batch = None
+        self._scratch = None
+        if self.batch_size > 1:
+            self._batch = EncodingBatch(self.batch_size, self.num_workers)
+            self._scratch = ScratchCanvases()
+        self._measure = ImageDraw.Draw(PIL.Image.new('RGBA', (1, 1), (0, 0, 0, 0)))
+        self._cache = None
+        if len(self.cache_dir) > 0:
+            self._cache = OverlayCache(self.cache_dir, self.cache_max_size * 1024 * 1024)
+            self._cache_options = serialize_options(self, exclude=CACHE_OPTIONS)
+        self._pyramid = parse_pyramid_sizes(self.pyramid_sizes)
+        if ((self.tile_size > 0) or (self.output_mode != OUTPUT_MODE_IMAGE) or (self._pyramid is not None)) and not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
 
     def _next_default_color(self):
         """
@@ -145,49 +299,47 @@ class AnnotationOverlayOD(
         self._default_colors_index += 1
         return result
 
-    def _get_color(self, label):
+    def _determine_color(self, label):
         """
-        Returns the color for the label.
+        Determines the color for a label that hasn't been assigned one yet.
 
-        :param label: the label to get the color for
+        :param label: the label to determine the color for
         :type label: str
         :return: the RGB color tuple
         :rtype: tuple
         """
-        if label not in self._colors:
-            has_custom = False
-            if label in self._label_mapping:
-                index = self._label_mapping[label]
-                if index < len(self._custom_colors):
-                    has_custom = True
-                    self._colors[label] = self._custom_colors[index]
-            if not has_custom:
-                self._colors[label] = self._next_default_color()
-        return self._colors[label]
-
-    def _get_outline_color(self, label):
-        """
-        Generates the color for the outline.
-
-        :param label: the label to get the color for
-        :type label: str
-        :return: the RGBA color tuple
-        :rtype: tuple
-        """
-        r, g, b = self._get_color(label)
-        return r, g, b, self.outline_alpha
+        # pre-declared labels
+        if label in self._label_order:
+            index = self._label_order[label]
+            if index < len(self._custom_colors):
+                return self._custom_colors[index]
+            return self._default_colors[index % len(self._default_colors)]
+
+        # stateless
+        if self.color_scheme == COLOR_SCHEME_HASH:
+            if len(self._custom_colors) > 0:
+                return hash_color(label, self._custom_colors)
+            return hash_color(label, self._default_colors)
+
+        # order of appearance
+        if label in self._label_mapping:
+            index = self._label_mapping[label]
+            if index < len(self._custom_colors):
+                return self._custom_colors[index]
+        return self._next_default_color()
 
-    def _get_fill_color(self, label):
+    def _get_color(self, label):
         """
-        Generates the color for the filling.
+        Returns the color for the label.
 
         :param label: the label to get the color for
         :type label: str
-        :return: the RGBA color tuple
+        :return: the RGB color tuple
         :rtype: tuple
         """
-        r, g, b = self._get_color(label)
-        return r, g, b, self.fill_alpha
+        if label not in self._colors:
+            self._colors[label] = self._determine_color(label)
+        return self._colors[label]
 
     def _expand_label(self, label, metadata):
         """
@@ -209,16 +361,15 @@ class AnnotationOverlayOD(
                 result = result.replace("{%s}" % key, ("%." + str(self.num_decimals) + "f") % float(value))
         return result
 
-    def _text_coords(self, draw, text, rect):
+    def _text_size(self, draw, text):
         """
-        Determines the text coordinates in the image.
+        Determines the size of the text.
 
         :param draw: the ImageDraw instance
         :type draw: ImageDraw
         :param text: the text to output
         :type text: str
-        :param rect: the rectangle to use as reference
-        :return: the x, y, w, h tuple
+        :return: the w, h tuple
         :rtype: tuple
         """
         try:
@@ -229,90 +380,499 @@ class AnnotationOverlayOD(
             ascent, descent = self._font.getmetrics()
             w = self._font.getmask(text).getbbox()[2]
             h = self._font.getmask(text).getbbox()[3] + descent
+        return w, h
+
+    def _text_coords(self, draw, text, rect):
+        """
+        Determines the text coordinates in the image.
+
+        :param draw: the ImageDraw instance
+        :type draw: ImageDraw
+        :param text: the text to output
+        :type text: str
+        :param rect: the rectangle (left, top, right, bottom) to use as reference
+        :type rect: tuple
+        :return: the x, y, w, h tuple
+        :rtype: tuple
+        """
+        w, h = self._text_size(draw, text)
+        left, top, right, bottom = rect
 
         # x
         if self._text_horizontal == "L":
-            x = rect.left()
+            x = left
         elif self._text_horizontal == "C":
-            x = rect.left() + (rect.right() - rect.left() - w) // 2
+            x = left + (right - left - w) // 2
         elif self._text_horizontal == "R":
-            x = rect.right() - w
+            x = right - w
         else:
             raise Exception("Unhandled horizontal text position: %s" % self._text_horizontal)
 
         # y
         if self._text_vertical == "T":
-            y = rect.top()
+            y = top
         elif self._text_vertical == "C":
-            y = rect.top() + (rect.bottom() - rect.top() - h) // 2
+            y = top + (bottom - top - h) // 2
         elif self._text_vertical == "B":
-            y = rect.bottom() - h
+            y = bottom - h
         else:
             raise Exception("Unhandled horizontal text position: %s" % self._text_horizontal)
 
         return x, y, w, h
 
-    def process_element(
-            self,
-            element: ImageObjectDetectionInstance,
-            then: ThenFunction[ImageObjectDetectionInstance],
-            done: DoneFunction
-    ):
-        if not hasattr(self, "_colors"):
-            self._initialize()
+    def _place_text(self, draw, text, rect, size, placed):
+        """
+        Finds a position for the text around/inside the rectangle that doesn't
+        overlap any of the already placed texts. Abbreviates the text if it
+        doesn't fit anywhere.
 
-        img_in = element.data
-        img_pil = element.data.pil_image
+        :param draw: the ImageDraw instance
+        :type draw: ImageDraw
+        :param text: the text to output
+        :type text: str
+        :param rect: the rectangle (left, top, right, bottom) to use as reference
+        :type rect: tuple
+        :param size: the (width, height) of the image
+        :type size: tuple
+        :param placed: the index of already placed texts, gets updated
+        :type placed: GridIndex
+        :return: the x, y, w, h, text tuple, None if it couldn't be placed
+        :rtype: tuple
+        """
+        left, top, right, bottom = rect
+        texts = [text]
+        if len(text) > ABBREVIATION_LENGTH + 1:
+            texts.append(text[:ABBREVIATION_LENGTH] + ".")
+        for current in texts:
+            w, h = self._text_size(draw, current)
+            candidates = [
+                (left, top - h - 1),
+                (left, top),
+                (right - w, top),
+                (left, bottom + 1),
+                (left, bottom - h),
+                (right - w, bottom - h),
+                (left + (right - left - w) // 2, top + (bottom - top - h) // 2),
+            ]
+            for x, y in candidates:
+                x = max(0, min(x, size[0] - w - 1))
+                y = max(0, min(y, size[1] - h - 1))
+                if not placed.intersects((x, y, x + w, y + h)):
+                    placed.insert((x, y, x + w, y + h), current)
+                    return x, y, w, h, current
+        return None
+
+    def _get_label(self, lobj):
+        """
+        Returns the label of the object.
 
-        overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
-        draw = ImageDraw.Draw(overlay)
-        for i, lobj in enumerate(element.annotations):
-            # determine label/color
-            label = "object"
-            if self.label_key in lobj.metadata:
-                label = lobj.metadata[self.label_key]
-            if self._accepted_labels is not None:
-                if label not in self._accepted_labels:
-                    continue
+        :param lobj: the object to get the label for
+        :type lobj: LocatedObject
+        :return: the label, "object" if not present
+        :rtype: str
+        """
+        if self.label_key in lobj.metadata:
+            return lobj.metadata[self.label_key]
+        return "object"
+
+    def _select_objects(self, annotations):
+        """
+        Selects the objects to draw, applying the accepted labels, the filter
+        expression and the top-k selection (in that order).
+
+        :param annotations: the annotations of the image
+        :type annotations: LocatedObjects
+        :return: the list of (index, located object) tuples
+        :rtype: list
+        """
+        result = list(enumerate(annotations))
+        if self._accepted_labels is not None:
+            result = [x for x in result if self._get_label(x[1]) in self._accepted_labels]
+        if self._filter is not None:
+            result = [x for x in result if self._filter(x[1].metadata)]
+        if self.top_k > 0:
+            result = top_k(result, self.top_k, self.top_k_key)
+        return result
+
+    def _assign_colors(self, annotations):
+        """
+        Determines the objects to draw along with their labels and colors.
+        Colors get determined in the order of the objects, so that the
+        sequential color scheme doesn't depend on the order of drawing.
+
+        :param annotations: the annotations of the image
+        :type annotations: LocatedObjects
+        :return: the list of (located object, label, RGB color) tuples
+        :rtype: list
+        """
+        result = []
+        for i, lobj in self._select_objects(annotations):
+            label = self._get_label(lobj)
             if label not in self._label_mapping:
                 self._label_mapping[label] = len(self._label_mapping)
             if self.vary_colors:
                 color_label = "object-%d" % i
             else:
                 color_label = label
+            result.append((lobj, label, self._get_color(color_label)))
+        return result
 
-            # assemble polygon
-            points = []
-            if lobj.has_polygon() and not self.force_bbox:
-                poly_x = lobj.get_polygon_x()
-                poly_y = lobj.get_polygon_y()
-                for x, y in zip(poly_x, poly_y):
-                    points.append((x, y))
-            else:
-                rect = lobj.get_rectangle()
-                points.append((rect.left(), rect.top()))
-                points.append((rect.right(), rect.top()))
-                points.append((rect.right(), rect.bottom()))
-                points.append((rect.left(), rect.bottom()))
-            if self.fill:
-                draw.polygon(tuple(points), outline=self._get_outline_color(color_label), fill=self._get_fill_color(color_label), width=self.outline_thickness)
-            else:
-                draw.polygon(tuple(points), outline=self._get_outline_color(color_label), width=self.outline_thickness)
-
-            # output text
+    def _objects_to_draw(self, annotations, size, scale_x=1.0, scale_y=1.0):
+        """
+        Determines the objects to draw, along with their colors and the
+        positions of the texts (in scaled coordinates).
+
+        :param annotations: the annotations of the image
+        :type annotations: LocatedObjects
+        :param size: the (width, height) of the image to draw on
+        :type size: tuple
+        :param scale_x: the factor to scale the x coordinates with
+        :type scale_x: float
+        :param scale_y: the factor to scale the y coordinates with
+        :type scale_y: float
+        :return: the list of (located object, RGB color, text) tuples, with text being
+                 either a (x, y, w, h, text) tuple or None if no text to output
+        :rtype: list
+        """
+        placed = None
+        if self._auto_placement:
+            placed = GridIndex(max(16, 4 * self.font_size))
+        result = []
+        for lobj, label, color in self._assign_colors(annotations):
+            # text
+            text = None
             if len(self.text_format) > 0:
-                text = self._expand_label(label, lobj.metadata)
-                rect = lobj.get_rectangle()
-                x, y, w, h = self._text_coords(draw, text, rect)
-                draw.rectangle((x, y, x+w, y+h), fill=self._get_outline_color(color_label))
-                draw.text((x, y), text, font=self._font, fill=text_color(self._get_color(color_label)))
+                expanded = self._expand_label(label, lobj.metadata)
+                rect = self._rectangle(lobj, scale_x=scale_x, scale_y=scale_y)
+                if placed is not None:
+                    text = self._place_text(self._measure, expanded, rect, size, placed)
+                else:
+                    text = self._text_coords(self._measure, expanded, rect) + (expanded,)
+
+            result.append((lobj, color, text))
+        return result
+
+    def _rectangle(self, lobj, scale_x=1.0, scale_y=1.0, offset_x=0, offset_y=0):
+        """
+        Returns the bounding box of the object in drawing coordinates.
+
+        :param lobj: the located object to get the bounding box for
+        :type lobj: LocatedObject
+        :param scale_x: the factor to scale the x coordinates with
+        :type scale_x: float
+        :param scale_y: the factor to scale the y coordinates with
+        :type scale_y: float
+        :param offset_x: the offset to add to the (scaled) x coordinates
+        :type offset_x: int
+        :param offset_y: the offset to add to the (scaled) y coordinates
+        :type offset_y: int
+        :return: the (left, top, right, bottom) tuple
+        :rtype: tuple
+        """
+        rect = lobj.get_rectangle()
+        if (scale_x == 1.0) and (scale_y == 1.0):
+            return rect.left() + offset_x, rect.top() + offset_y, rect.right() + offset_x, rect.bottom() + offset_y
+        return int(rect.left() * scale_x) + offset_x, int(rect.top() * scale_y) + offset_y, \
+            int(rect.right() * scale_x) + offset_x, int(rect.bottom() * scale_y) + offset_y
+
+    def _polygon_points(self, lobj, scale_x=1.0, scale_y=1.0, offset_x=0, offset_y=0):
+        """
+        Assembles the points of the polygon (or bounding box) to draw.
+
+        :param lobj: the located object to get the points for
+        :type lobj: LocatedObject
+        :param scale_x: the factor to scale the x coordinates with
+        :type scale_x: float
+        :param scale_y: the factor to scale the y coordinates with
+        :type scale_y: float
+        :param offset_x: the offset to add to the (scaled) x coordinates
+        :type offset_x: int
+        :param offset_y: the offset to add to the (scaled) y coordinates
+        :type offset_y: int
+        :return: the list of (x, y) tuples
+        :rtype: list
+        """
+        points = []
+        if lobj.has_polygon() and not self.force_bbox:
+            scaled = scale_polygon(lobj.get_polygon_x(), lobj.get_polygon_y(),
+                                   scale_x=scale_x, scale_y=scale_y, tolerance=self.lod_tolerance)
+            for x, y in scaled.tolist():
+                points.append((x + offset_x, y + offset_y))
+        else:
+            left, top, right, bottom = self._rectangle(lobj, scale_x=scale_x, scale_y=scale_y, offset_x=offset_x, offset_y=offset_y)
+            points.append((left, top))
+            points.append((right, top))
+            points.append((right, bottom))
+            points.append((left, bottom))
+        return points
+
+    def _outline_thickness(self, scale_x=1.0, scale_y=1.0):
+        """
+        Returns the outline thickness to use at the given scale.
+
+        :param scale_x: the horizontal scale factor
+        :type scale_x: float
+        :param scale_y: the vertical scale factor
+        :type scale_y: float
+        :return: the thickness
+        :rtype: int
+        """
+        if (self.outline_thickness < 1) or ((scale_x == 1.0) and (scale_y == 1.0)):
+            return self.outline_thickness
+        return max(1, int(round(self.outline_thickness * min(scale_x, scale_y))))
+
+    def _object_bounds(self, lobj, text):
+        """
+        Determines the area (shape, outline and text) that drawing the object affects.
+
+        :param lobj: the located object
+        :type lobj: LocatedObject
+        :param text: the (x, y, w, h, text) tuple, None if no text
+        :type text: tuple
+        :return: the (x0, y0, x1, y1) tuple
+        :rtype: tuple
+        """
+        points = self._polygon_points(lobj)
+        margin = max(0, self.outline_thickness)
+        x0 = min(p[0] for p in points) - margin
+        y0 = min(p[1] for p in points) - margin
+        x1 = max(p[0] for p in points) + margin
+        y1 = max(p[1] for p in points) + margin
+        if text is not None:
+            x, y, w, h, _ = text
+            x0 = min(x0, x)
+            y0 = min(y0, y)
+            x1 = max(x1, x + w)
+            y1 = max(y1, y + h)
+        return x0, y0, x1, y1
+
+    def _draw_object(self, draw, lobj, color, text, scale_x=1.0, scale_y=1.0, offset_x=0, offset_y=0):
+        """
+        Draws the shape and text of the object.
+
+        :param draw: the ImageDraw instance to draw with
+        :type draw: ImageDraw
+        :param lobj: the located object to draw
+        :type lobj: LocatedObject
+        :param color: the RGB color of the object
+        :type color: tuple
+        :param text: the (x, y, w, h, text) tuple in scaled coordinates, None if no text
+        :type text: tuple
+        :param scale_x: the factor to scale the x coordinates with
+        :type scale_x: float
+        :param scale_y: the factor to scale the y coordinates with
+        :type scale_y: float
+        :param offset_x: the offset to add to the (scaled) x coordinates
+        :type offset_x: int
+        :param offset_y: the offset to add to the (scaled) y coordinates
+        :type offset_y: int
+        """
+        points = self._polygon_points(lobj, scale_x=scale_x, scale_y=scale_y, offset_x=offset_x, offset_y=offset_y)
+        thickness = self._outline_thickness(scale_x=scale_x, scale_y=scale_y)
+        r, g, b = color
+        if self.fill:
+            draw.polygon(tuple(points), outline=(r, g, b, self.outline_alpha), fill=(r, g, b, self.fill_alpha), width=thickness)
+        else:
+            draw.polygon(tuple(points), outline=(r, g, b, self.outline_alpha), width=thickness)
+
+        # output text
+        if text is not None:
+            x, y, w, h, text = text
+            x += offset_x
+            y += offset_y
+            draw.rectangle((x, y, x+w, y+h), fill=(r, g, b, self.outline_alpha))
+            draw.text((x, y), text, font=self._font, fill=text_color(color))
+
+    def _process_tiled(self, element: ImageObjectDetectionInstance):
+        """
+        Renders the image tile by tile and writes the tiles to the output directory.
+        Only the objects that touch a tile get drawn on it.
+
+        :param element: the element to render
+        :type element: ImageObjectDetectionInstance
+        """
+        img_pil = element.data.pil_image
+        width, height = img_pil.size
+
+        # index the objects by the area that they affect
+        index = GridIndex(self.tile_size)
+        for obj in self._objects_to_draw(element.annotations, img_pil.size):
+            index.insert(self._object_bounds(obj[0], obj[2]), obj)
+
+        for row, col, box in tile_boxes(width, height, self.tile_size):
+            tile = img_pil.crop(box)
+            objects = index.query((box[0], box[1], box[2] - 1, box[3] - 1))
+            if len(objects) > 0:
+                overlay = PIL.Image.new('RGBA', tile.size, (0, 0, 0, 0))
+                draw = ImageDraw.Draw(overlay)
+                for lobj, color, text in objects:
+                    self._draw_object(draw, lobj, color, text, offset_x=-box[0], offset_y=-box[1])
+                tile.paste(overlay, (0, 0), mask=overlay)
+            tile.save(tile_filename(self.output_dir, element.data.filename, row, col), format="PNG")
+
+    def _write_layer_png(self, element: ImageObjectDetectionInstance):
+        """
+        Writes only the overlay layer (at the original resolution) as PNG to the output directory.
+
+        :param element: the element to generate the layer for
+        :type element: ImageObjectDetectionInstance
+        """
+        overlay = PIL.Image.new('RGBA', element.data.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        for lobj, color, text in self._objects_to_draw(element.annotations, overlay.size):
+            self._draw_object(draw, lobj, color, text)
+        overlay.save(layer_filename(self.output_dir, element.data.filename, ".png"), format="PNG")
+
+    def _write_layer_svg(self, element: ImageObjectDetectionInstance):
+        """
+        Writes only the overlay layer (polygons and labels) as SVG to the output directory.
+
+        :param element: the element to generate the layer for
+        :type element: ImageObjectDetectionInstance
+        """
+        elements = []
+        width, height = element.data.size
+        for lobj, color, text in self._objects_to_draw(element.annotations, element.data.size):
+            elements.append(svg_polygon(
+                self._polygon_points(lobj), color, self.outline_alpha, self.outline_thickness,
+                fill=color if self.fill else None, fill_alpha=self.fill_alpha))
+            if text is not None:
+                x, y, w, h, text = text
+                elements.append(svg_rect(x, y, w, h, color, self.outline_alpha))
+                elements.append(svg_text(x, y, text, text_color(color), self.font_family, self.font_size))
+        with open(layer_filename(self.output_dir, element.data.filename, ".svg"), "w") as fp:
+            fp.write(svg_document(width, height, elements))
+
+    def _write_pyramid(self, img, img_pil=None):
+        """
+        Writes the pyramid levels of the output image to the output directory, if enabled.
+
+        :param img: the output image
+        :type img: Image
+        :param img_pil: the rendered image, None to decode the output image
+        :type img_pil: PIL.Image.Image
+        """
+        if self._pyramid is None:
+            return
+        if img_pil is None:
+            img_pil = img.pil_image
+        write_pyramid(img_pil, self._pyramid, self.output_dir, img.filename, img.format.pil_format_string)
+
+    def _render(self, element: ImageObjectDetectionInstance):
+        """
+        Renders the overlay onto the image (or retrieves the output from the cache).
 
-        img_pil.paste(overlay, (0, 0), mask=overlay)
+        :param element: the element to render
+        :type element: ImageObjectDetectionInstance
+        :return: the tuple of output element (if cached, otherwise None), the rendered image and the cache key (None if not caching)
+        :rtype: tuple
+        """
+        img_in = element.data
 
-        # convert back to PIL bytes
-        pil_img_bytes = io.BytesIO()
-        img_pil.save(pil_img_bytes, format=img_in.format.pil_format_string)
-        img_out = Image(img_in.filename, pil_img_bytes.getvalue(), img_in.format, img_in.size)
+        # cached? (the colors get determined beforehand, as they depend on the previous images with the sequential color scheme)
+        cache_key = None
+        if self._cache is not None:
+            colors = [x[2] for x in self._assign_colors(element.annotations)]
+            cache_key = fingerprint(img_in.data, serialize_annotations(element.annotations), self._cache_options, repr(colors).encode())
+            data = self._cache.get(cache_key)
+            if data is not None:
+                output = element.__class__(Image(img_in.filename, data, img_in.format), element.annotations)
+                self._write_pyramid(output.data)
+                return output, None, None
+
+        img_pil, scale_x, scale_y = downscale(element.data.pil_image, self._max_size)
+
+        # same annotations and size as previous image?
+        overlay = None
+        reuse_key = None
+        if self.reuse_overlay:
+            reuse_key = fingerprint(serialize_annotations(element.annotations), repr((element.data.pil_image.size, img_pil.size)).encode())
+            if reuse_key == self._reuse_key:
+                overlay = self._reuse_overlay
+
+        if overlay is None:
+            # opaque shapes can be drawn onto the image directly, no need for compositing
+            if self._opaque and (img_pil.mode in DIRECT_DRAW_MODES) and not self.reuse_overlay:
+                draw = ImageDraw.Draw(img_pil)
+            else:
+                if (self._scratch is not None) and not self.reuse_overlay:
+                    overlay = self._scratch.get(img_pil.size)
+                else:
+                    overlay = PIL.Image.new('RGBA', img_pil.size, (0, 0, 0, 0))
+                draw = ImageDraw.Draw(overlay)
+            for lobj, color, text in self._objects_to_draw(element.annotations, img_pil.size, scale_x=scale_x, scale_y=scale_y):
+                self._draw_object(draw, lobj, color, text, scale_x=scale_x, scale_y=scale_y)
+            if reuse_key is not None:
+                self._reuse_key = reuse_key
+                self._reuse_overlay = overlay
+
+        if overlay is not None:
+            img_pil.paste(overlay, (0, 0), mask=overlay)
+
+        return None, img_pil, cache_key
+
+    def _finalize(self, element: ImageObjectDetectionInstance, img_pil, cache_key, data):
+        """
+        Generates the output element from the encoded image, caching it if necessary.
+
+        :param element: the element that got rendered
+        :type element: ImageObjectDetectionInstance
+        :param img_pil: the rendered image
+        :type img_pil: PIL.Image.Image
+        :param cache_key: the key to cache the image under, None if not caching
+        :type cache_key: str
+        :param data: the encoded image
+        :type data: bytes
+        :return: the new element
+        :rtype: ImageObjectDetectionInstance
+        """
+        if cache_key is not None:
+            self._cache.put(cache_key, data)
+        img_out = Image(element.data.filename, data, element.data.format, img_pil.size)
+        self._write_pyramid(img_out, img_pil=img_pil)
+        return element.__class__(img_out, element.annotations)
+
+    @profiled
+    def process_element(
+            self,
+            element: ImageObjectDetectionInstance,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if not hasattr(self, "_colors"):
+            self._initialize()
 
-        # new element
-        then(element.__class__(img_out, element.annotations))
+        if self.tile_size > 0:
+            self._process_tiled(element)
+            then(element)
+            return
+
+        if self.output_mode == OUTPUT_MODE_LAYER_PNG:
+            self._write_layer_png(element)
+            then(element)
+            return
+        elif self.output_mode == OUTPUT_MODE_LAYER_SVG:
+            self._write_layer_svg(element)
+            then(element)
+            return
+
+        output, img_pil, cache_key = self._render(element)
+        if self._batch is not None:
+            self._batch.add(element, output=output, img_pil=img_pil, cache_key=cache_key)
+            if self._batch.is_full():
+                self._batch.flush(self._finalize, then)
+            return
+        if output is None:
+            output = self._finalize(element, img_pil, cache_key, encode_image(img_pil, element.data.format.pil_format_string))
+        then(output)
+
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_colors") and (self._batch is not None):
+            self._batch.flush(self._finalize, then)
+            self._batch.close()
+        done()
@@ -1,3 +1,4 @@
+from ._AnnotationDiffOD import AnnotationDiffOD
 from ._AnnotationOverlayIC import AnnotationOverlayIC
 from ._AnnotationOverlayIS import AnnotationOverlayIS
 from ._AnnotationOverlayOD import AnnotationOverlayOD
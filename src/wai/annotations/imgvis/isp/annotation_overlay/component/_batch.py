@@ -0,0 +1,127 @@
+import io
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+# the number of different image sizes to keep scratch canvases for
+MAX_SCRATCH_SIZES = 4
+
+
+def encode_image(img_pil, pil_format):
+    """
+    Encodes the image (Pillow releases the GIL while encoding).
+
+    :param img_pil: the image to encode
+    :type img_pil: Image.Image
+    :param pil_format: the Pillow format string to use
+    :type pil_format: str
+    :return: the encoded image
+    :rtype: bytes
+    """
+    pil_img_bytes = io.BytesIO()
+    img_pil.save(pil_img_bytes, format=pil_format)
+    return pil_img_bytes.getvalue()
+
+
+class ScratchCanvases(object):
+    """
+    Keeps transparent RGBA canvases for the most recently used image sizes,
+    which get cleared and reused rather than allocated for every image.
+    """
+
+    def __init__(self, max_sizes=MAX_SCRATCH_SIZES):
+        """
+        Initializes the canvases.
+
+        :param max_sizes: the maximum number of image sizes to keep canvases for
+        :type max_sizes: int
+        """
+        self._max_sizes = max_sizes
+        self._canvases = OrderedDict()
+
+    def get(self, size):
+        """
+        Returns a cleared canvas of the specified size.
+
+        :param size: the (width, height) of the canvas
+        :type size: tuple
+        :return: the canvas
+        :rtype: Image.Image
+        """
+        size = tuple(size)
+        if size in self._canvases:
+            canvas = self._canvases[size]
+            canvas.paste((0, 0, 0, 0), (0, 0) + size)
+            self._canvases.move_to_end(size)
+        else:
+            canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+            self._canvases[size] = canvas
+            while len(self._canvases) > self._max_sizes:
+                self._canvases.popitem(last=False)
+        return canvas
+
+
+class EncodingBatch(object):
+    """
+    Buffers the rendered images of a batch, encodes them on a thread pool
+    and forwards the elements in their original order.
+    """
+
+    def __init__(self, batch_size, num_workers):
+        """
+        Initializes the batch.
+
+        :param batch_size: the number of elements to buffer
+        :type batch_size: int
+        :param num_workers: the number of threads to use for encoding
+        :type num_workers: int
+        """
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_workers))
+        self._items = []
+
+    def add(self, element, output=None, img_pil=None, cache_key=None):
+        """
+        Adds an element to the batch, queuing the encoding of the rendered image.
+
+        :param element: the element that got rendered
+        :param output: the output element if no encoding is necessary, e.g., when cached
+        :param img_pil: the rendered image to encode, if output is None
+        :type img_pil: Image.Image
+        :param cache_key: the key to cache the encoded image under, None if not caching
+        :type cache_key: str
+        """
+        future = None
+        if output is None:
+            future = self._executor.submit(encode_image, img_pil, element.data.format.pil_format_string)
+        self._items.append((element, output, img_pil, cache_key, future))
+
+    def is_full(self):
+        """
+        Returns whether the batch is full.
+
+        :return: True if full
+        :rtype: bool
+        """
+        return len(self._items) >= self.batch_size
+
+    def flush(self, finalize, then):
+        """
+        Forwards the elements of the batch, in order.
+
+        :param finalize: the method for generating the output element from (element, img_pil, cache_key, data)
+        :param then: the function to forward the elements with
+        """
+        items = self._items
+        self._items = []
+        for element, output, img_pil, cache_key, future in items:
+            if output is None:
+                output = finalize(element, img_pil, cache_key, future.result())
+            then(output)
+
+    def close(self):
+        """
+        Stops the encoding threads.
+        """
+        self._executor.shutdown()
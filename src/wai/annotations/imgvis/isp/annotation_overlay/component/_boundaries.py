@@ -0,0 +1,35 @@
+import numpy as np
+
+STYLE_FILL = "fill"
+STYLE_OUTLINE = "outline"
+STYLES = [
+    STYLE_FILL,
+    STYLE_OUTLINE,
+]
+
+
+def boundary_mask(indices, thickness=1):
+    """
+    Determines the boundary pixels of the labels by comparing the label index
+    array with its shifted copies (4-neighbourhood), i.e., all labels at once.
+    A pixel is a boundary pixel if a pixel within the given distance horizontally
+    or vertically has a different index. Background pixels (index 0) are never
+    boundary pixels, i.e., the boundaries lie on the inside of the labels.
+
+    :param indices: the 2D array of label indices
+    :type indices: np.ndarray
+    :param thickness: the thickness of the boundaries in pixels
+    :type thickness: int
+    :return: the boolean mask of the boundary pixels
+    :rtype: np.ndarray
+    """
+    result = np.zeros(indices.shape, dtype=bool)
+    for k in range(1, max(1, thickness) + 1):
+        diff = indices[:, k:] != indices[:, :-k]
+        result[:, k:] |= diff
+        result[:, :-k] |= diff
+        diff = indices[k:, :] != indices[:-k, :]
+        result[k:, :] |= diff
+        result[:-k, :] |= diff
+    result &= (indices != 0)
+    return result
@@ -0,0 +1,115 @@
+import os
+from collections import OrderedDict
+
+CACHE_EXTENSION = ".cache"
+
+# the options that don't influence the rendered images
+CACHE_OPTIONS = [
+    "cache_dir",
+    "cache_max_size",
+    "reuse_overlay",
+    "batch_size",
+    "num_workers",
+    "pyramid_sizes",
+]
+
+
+class OverlayCache(object):
+    """
+    Content-addressed on-disk cache for rendered images. The files get stored
+    under their key, with the least recently used ones getting removed once
+    the total size exceeds the limit. The modification time of the files
+    determines the order of use, so the order survives between runs.
+    """
+
+    def __init__(self, cache_dir, max_size):
+        """
+        Initializes the cache, indexing any files already present.
+
+        :param cache_dir: the directory to store the files in
+        :type cache_dir: str
+        :param max_size: the maximum size of the cache in bytes
+        :type max_size: int
+        """
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        files = []
+        for f in os.listdir(cache_dir):
+            if f.endswith(CACHE_EXTENSION):
+                stat = os.stat(os.path.join(cache_dir, f))
+                files.append((stat.st_mtime, f[:-len(CACHE_EXTENSION)], stat.st_size))
+        files.sort()
+        for _, key, size in files:
+            self._entries[key] = size
+            self._size += size
+
+    def _path(self, key):
+        """
+        Returns the path of the file for the key.
+
+        :param key: the key of the entry
+        :type key: str
+        :return: the path
+        :rtype: str
+        """
+        return os.path.join(self._cache_dir, key + CACHE_EXTENSION)
+
+    def get(self, key):
+        """
+        Returns the cached data for the key, marking the entry as recently used.
+
+        :param key: the key of the entry
+        :type key: str
+        :return: the data, None if not cached
+        :rtype: bytes
+        """
+        if key not in self._entries:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fp:
+                result = fp.read()
+            os.utime(path)
+        except OSError:
+            self._size -= self._entries.pop(key)
+            return None
+        self._entries.move_to_end(key)
+        return result
+
+    def put(self, key, data):
+        """
+        Stores the data under the key and removes the least recently used
+        entries if the cache has grown too large.
+
+        :param key: the key of the entry
+        :type key: str
+        :param data: the data to store
+        :type data: bytes
+        """
+        path = self._path(key)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fp:
+            fp.write(data)
+        os.replace(tmp, path)
+        if key in self._entries:
+            self._size -= self._entries.pop(key)
+        self._entries[key] = len(data)
+        self._size += len(data)
+        self._evict()
+
+    def _evict(self):
+        """
+        Removes the least recently used entries until the cache fits within the limit
+        again (the most recent entry is always kept).
+        """
+        while (self._size > self._max_size) and (len(self._entries) > 1):
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
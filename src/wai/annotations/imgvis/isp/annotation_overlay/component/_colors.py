@@ -1,5 +1,14 @@
+import zlib
+
 from PIL import ImageColor
 
+COLOR_SCHEME_SEQUENTIAL = "sequential"
+COLOR_SCHEME_HASH = "hash"
+COLOR_SCHEMES = [
+    COLOR_SCHEME_SEQUENTIAL,
+    COLOR_SCHEME_HASH,
+]
+
 # https://en.wikipedia.org/wiki/X11_color_names
 X11_COLORS = [
     "#F0F8FF",
@@ -236,3 +245,30 @@ def text_color(color, threshold=128):
         return 0, 0, 0
     else:
         return 255, 255, 255
+
+
+def label_hash(label):
+    """
+    Computes a stable hash for the label, i.e., one that does not change
+    between Python processes (unlike the builtin hash function).
+
+    :param label: the label to hash
+    :type label: str
+    :return: the hash value
+    :rtype: int
+    """
+    return zlib.crc32(label.encode("utf-8"))
+
+
+def hash_color(label, colors):
+    """
+    Picks a color from the palette using the stable hash of the label.
+
+    :param label: the label to get the color for
+    :type label: str
+    :param colors: the palette to choose from
+    :type colors: list
+    :return: the color tuple
+    :rtype: tuple
+    """
+    return colors[label_hash(label) % len(colors)]
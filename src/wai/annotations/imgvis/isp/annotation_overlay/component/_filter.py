@@ -0,0 +1,104 @@
+import ast
+import heapq
+
+# the syntax allowed in filter expressions
+ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div,
+    ast.Compare, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn,
+    ast.Name, ast.Load, ast.Constant, ast.Set, ast.List, ast.Tuple,
+)
+
+
+class _Literals(ast.NodeTransformer):
+    """
+    Turns bare names inside collection literals into strings, e.g., {car,truck}.
+    """
+
+    def _convert(self, node):
+        node.elts = [ast.copy_location(ast.Constant(x.id), x) if isinstance(x, ast.Name) else self.visit(x) for x in node.elts]
+        return node
+
+    visit_Set = _convert
+    visit_List = _convert
+    visit_Tuple = _convert
+
+
+class _Values(dict):
+    """
+    Namespace for evaluating an expression against the meta-data of an object:
+    numeric strings get turned into floats and missing keys evaluate to None.
+    """
+
+    def __init__(self, metadata):
+        super().__init__()
+        self._metadata = metadata
+
+    def __missing__(self, key):
+        value = self._metadata.get(key, None)
+        if isinstance(value, str):
+            try:
+                value = float(value)
+            except ValueError:
+                pass
+        return value
+
+
+def compile_filter(expression):
+    """
+    Compiles the filter expression into a predicate for the meta-data of objects.
+    The expression is a Python-like boolean expression using the meta-data keys
+    as variables, e.g.: score >= 0.5 and type in {car,truck}
+    Only comparisons, boolean operators, basic arithmetic and literals are allowed.
+    Objects for which the expression can't be evaluated (e.g., missing values) get
+    rejected.
+
+    :param expression: the expression to compile
+    :type expression: str
+    :return: the predicate, taking the meta-data dictionary and returning a bool
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise Exception("Invalid filter expression '%s': %s" % (expression, str(e)))
+    tree = ast.fix_missing_locations(_Literals().visit(tree))
+    for node in ast.walk(tree):
+        if not isinstance(node, ALLOWED_NODES):
+            raise Exception("Unsupported syntax in filter expression '%s': %s" % (expression, type(node).__name__))
+    code = compile(tree, "<filter>", "eval")
+    no_builtins = {"__builtins__": {}}
+
+    def predicate(metadata):
+        try:
+            return bool(eval(code, no_builtins, _Values(metadata)))
+        except (TypeError, ArithmeticError):
+            return False
+
+    return predicate
+
+
+def top_k(objects, k, key):
+    """
+    Selects the objects with the K largest values for the meta-data key.
+    Objects without a numeric value rank last. The order of the objects is retained.
+
+    :param objects: the list of (index, located object) tuples to select from
+    :type objects: list
+    :param k: the number of objects to keep
+    :type k: int
+    :param key: the meta-data key with the values to rank by
+    :type key: str
+    :return: the selected (index, located object) tuples
+    :rtype: list
+    """
+    if len(objects) <= k:
+        return objects
+
+    def value(obj):
+        try:
+            return float(obj[1].metadata[key])
+        except:
+            return float("-inf")
+
+    selected = heapq.nlargest(k, objects, key=value)
+    return sorted(selected, key=lambda x: x[0])
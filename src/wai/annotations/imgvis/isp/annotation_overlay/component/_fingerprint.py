@@ -0,0 +1,64 @@
+import hashlib
+
+from wai.common.adams.imaging.locateobjects import LocatedObjects
+from wai.annotations.domain.classification import Classification
+from wai.annotations.domain.image.segmentation import ImageSegmentationAnnotation
+
+
+def serialize_annotations(annotations):
+    """
+    Turns the annotations into bytes, for computing fingerprints.
+
+    :param annotations: the annotations to serialize (classification, object detection, segmentation or None)
+    :return: the serialized annotations
+    :rtype: bytes
+    """
+    if annotations is None:
+        return b"None"
+    elif isinstance(annotations, Classification):
+        return ("label=%s" % annotations.label).encode("utf-8")
+    elif isinstance(annotations, LocatedObjects):
+        parts = []
+        for lobj in annotations:
+            metadata = ",".join(["%s=%r" % (k, lobj.metadata[k]) for k in sorted(lobj.metadata.keys())])
+            parts.append("%d,%d,%d,%d|%s" % (lobj.x, lobj.y, lobj.width, lobj.height, metadata))
+        return "\n".join(parts).encode("utf-8")
+    elif isinstance(annotations, ImageSegmentationAnnotation):
+        return ("%s|%d,%d|" % (",".join(annotations.labels), annotations.size[0], annotations.size[1])).encode("utf-8") \
+               + annotations.indices.tobytes()
+    else:
+        raise Exception("Unhandled annotations type: %s" % str(type(annotations)))
+
+
+def serialize_options(component, exclude=None):
+    """
+    Turns the options of the component into bytes, for computing fingerprints.
+
+    :param component: the component to get the options from
+    :param exclude: the names of the options to ignore
+    :type exclude: list
+    :return: the serialized options
+    :rtype: bytes
+    """
+    options = vars(component.namespace)
+    parts = []
+    for name in sorted(options.keys()):
+        if (exclude is not None) and (name in exclude):
+            continue
+        parts.append("%s=%r" % (name, options[name]))
+    return "\n".join(parts).encode("utf-8")
+
+
+def fingerprint(*parts):
+    """
+    Computes the SHA-256 fingerprint of the byte strings.
+
+    :param parts: the byte strings to compute the fingerprint for
+    :return: the fingerprint (hex digest)
+    :rtype: str
+    """
+    hasher = hashlib.sha256()
+    for part in parts:
+        hasher.update(len(part).to_bytes(8, "little"))
+        hasher.update(part)
+    return hasher.hexdigest()
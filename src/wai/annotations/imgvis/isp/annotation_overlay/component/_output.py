@@ -0,0 +1,37 @@
+import os
+
+OUTPUT_MODE_IMAGE = "image"
+OUTPUT_MODE_LAYER_PNG = "layer-png"
+OUTPUT_MODE_LAYER_SVG = "layer-svg"
+OUTPUT_MODES = [
+    OUTPUT_MODE_IMAGE,
+    OUTPUT_MODE_LAYER_PNG,
+    OUTPUT_MODE_LAYER_SVG,
+]
+OUTPUT_MODES_RASTER = [
+    OUTPUT_MODE_IMAGE,
+    OUTPUT_MODE_LAYER_PNG,
+]
+
+# the image modes that opaque overlays can be drawn onto directly (with an alpha
+# channel, anti-aliased edges would end up in the alpha channel of the image)
+DIRECT_DRAW_MODES = [
+    "RGB",
+]
+
+
+def layer_filename(output_dir, filename, extension):
+    """
+    Generates the filename for the overlay layer of an image.
+
+    :param output_dir: the directory to place the layer in
+    :type output_dir: str
+    :param filename: the filename of the image the layer belongs to
+    :type filename: str
+    :param extension: the extension to use for the layer (incl dot)
+    :type extension: str
+    :return: the filename of the layer
+    :rtype: str
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output_dir, "%s-overlay%s" % (name, extension))
@@ -0,0 +1,112 @@
+import os
+
+from PIL import Image
+
+from wai.annotations.imgvis.isp.annotation_overlay.component._scaling import parse_size
+
+
+def parse_pyramid_sizes(sizes):
+    """
+    Parses the WIDTH,HEIGHT strings of the pyramid levels.
+
+    :param sizes: the strings to parse, can be None
+    :type sizes: list
+    :return: the list of unique (width, height) tuples, None if no levels
+    :rtype: list
+    """
+    if sizes is None:
+        return None
+    result = [parse_size(x) for x in sizes]
+    result = [x for x in result if x is not None]
+    if len(result) == 0:
+        return None
+    return list(dict.fromkeys(result))
+
+
+def _reducible(img_pil):
+    """
+    Converts the image into a mode that supports reducing and smooth resizing,
+    if necessary (e.g., palette or bilevel images).
+
+    :param img_pil: the image to convert
+    :type img_pil: Image.Image
+    :return: the (converted) image
+    :rtype: Image.Image
+    """
+    if img_pil.mode == "1":
+        return img_pil.convert("L")
+    if img_pil.mode == "P":
+        return img_pil.convert("RGBA" if "transparency" in img_pil.info else "RGB")
+    if img_pil.mode.startswith("I;16"):
+        return img_pil.convert("I")
+    return img_pil
+
+
+def pyramid_levels(img_pil, sizes):
+    """
+    Generates the downsampled versions of the image. The target size of each
+    level gets determined for the image first, then the levels get generated
+    largest first: each level gets derived from the previous (larger) one,
+    halving it (box filter) for as long as it stays larger than the target size,
+    followed by a final resize to the exact size.
+
+    :param img_pil: the full resolution image
+    :type img_pil: Image.Image
+    :param sizes: the maximum (width, height) tuples of the levels
+    :type sizes: list
+    :return: the generator of (max size, image) tuples
+    """
+    width, height = img_pil.size
+    targets = []
+    for max_size in sizes:
+        scale = min(1.0, max_size[0] / width, max_size[1] / height)
+        targets.append((max_size, (max(1, int(round(width * scale))), max(1, int(round(height * scale))))))
+    targets.sort(key=lambda x: x[1], reverse=True)
+    current = img_pil
+    for max_size, target in targets:
+        # only ever derive a level from a larger one
+        if (current.size[0] < target[0]) or (current.size[1] < target[1]):
+            current = img_pil
+        if current.size != target:
+            current = _reducible(current)
+            while (current.size[0] // 2 >= target[0]) and (current.size[1] // 2 >= target[1]):
+                current = current.reduce(2)
+            if current.size != target:
+                current = current.resize(target, Image.BILINEAR)
+        yield max_size, current
+
+
+def pyramid_filename(output_dir, filename, max_size):
+    """
+    Generates the filename for a pyramid level of an image.
+
+    :param output_dir: the directory to place the level in
+    :type output_dir: str
+    :param filename: the filename of the image the level belongs to
+    :type filename: str
+    :param max_size: the maximum (width, height) of the level
+    :type max_size: tuple
+    :return: the filename of the level
+    :rtype: str
+    """
+    name, ext = os.path.splitext(os.path.basename(filename))
+    return os.path.join(output_dir, "%s-%dx%d%s" % (name, max_size[0], max_size[1], ext))
+
+
+def write_pyramid(img_pil, sizes, output_dir, filename, pil_format):
+    """
+    Writes the pyramid levels of the image to the output directory.
+
+    :param img_pil: the full resolution image
+    :type img_pil: Image.Image
+    :param sizes: the maximum (width, height) tuples of the levels
+    :type sizes: list
+    :param output_dir: the directory to write the levels to
+    :type output_dir: str
+    :param filename: the filename of the image
+    :type filename: str
+    :param pil_format: the Pillow format string to use
+    :type pil_format: str
+    """
+    for max_size, level in pyramid_levels(img_pil, sizes):
+        level.save(pyramid_filename(output_dir, filename, max_size), format=pil_format)
@@ -0,0 +1,45 @@
+from PIL import Image
+
+
+def parse_size(size):
+    """
+    Parses the WIDTH,HEIGHT string.
+
+    :param size: the string to parse, can be empty
+    :type size: str
+    :return: the (width, height) tuple, None if empty string
+    :rtype: tuple
+    """
+    if (size is None) or (len(size.strip()) == 0):
+        return None
+    result = tuple([int(x) for x in size.split(",")])
+    if len(result) != 2:
+        raise Exception("Expected format 'width,height' but received: %s" % size)
+    return result
+
+
+def downscale(img_pil, max_size):
+    """
+    Scales down the image to fit within the maximum size (keeping the aspect ratio).
+    For JPEG images, the decoder gets instructed to decode at a reduced resolution
+    already (if the image hasn't been loaded yet), which avoids decoding the full image.
+
+    :param img_pil: the image to scale down
+    :type img_pil: Image.Image
+    :param max_size: the maximum (width, height), None for no scaling
+    :type max_size: tuple
+    :return: the (image, scale_x, scale_y) tuple, the scale factors map original to scaled coordinates
+    :rtype: tuple
+    """
+    if max_size is None:
+        return img_pil, 1.0, 1.0
+    width, height = img_pil.size
+    scale = min(max_size[0] / width, max_size[1] / height)
+    if scale >= 1.0:
+        return img_pil, 1.0, 1.0
+    target = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    # JPEG can decode at 1/2, 1/4 or 1/8 of the resolution (no-op for other formats)
+    img_pil.draft(img_pil.mode, target)
+    if img_pil.size != target:
+        img_pil = img_pil.resize(target, Image.BILINEAR, reducing_gap=2.0)
+    return img_pil, target[0] / width, target[1] / height
@@ -0,0 +1,100 @@
+def rects_intersect(rect1, rect2):
+    """
+    Checks whether the two rectangles intersect.
+
+    :param rect1: the first rectangle (x0, y0, x1, y1), inclusive
+    :type rect1: tuple
+    :param rect2: the second rectangle (x0, y0, x1, y1), inclusive
+    :type rect2: tuple
+    :return: True if they intersect
+    :rtype: bool
+    """
+    return (rect1[0] <= rect2[2]) and (rect2[0] <= rect1[2]) \
+        and (rect1[1] <= rect2[3]) and (rect2[1] <= rect1[3])
+
+
+class GridIndex(object):
+    """
+    Uniform grid for looking up items via the rectangles that they cover.
+    Each item gets registered with all the cells its rectangle touches,
+    so lookups only need to check the items of the cells that the query
+    rectangle touches rather than all items.
+    """
+
+    def __init__(self, cell_size):
+        """
+        Initializes the index.
+
+        :param cell_size: the width/height of the cells
+        :type cell_size: int
+        """
+        self._cell_size = max(1, int(cell_size))
+        self._cells = dict()
+        self._entries = []
+
+    def _cells_for(self, rect):
+        """
+        Returns the cell coordinates that the rectangle touches.
+
+        :param rect: the rectangle (x0, y0, x1, y1)
+        :type rect: tuple
+        :return: the generator of (col, row) tuples
+        """
+        col0 = int(rect[0]) // self._cell_size
+        row0 = int(rect[1]) // self._cell_size
+        col1 = int(rect[2]) // self._cell_size
+        row1 = int(rect[3]) // self._cell_size
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                yield col, row
+
+    def insert(self, rect, item):
+        """
+        Adds the item with the rectangle it covers.
+
+        :param rect: the rectangle (x0, y0, x1, y1), inclusive
+        :type rect: tuple
+        :param item: the item to store
+        """
+        index = len(self._entries)
+        self._entries.append((rect, item))
+        for cell in self._cells_for(rect):
+            if cell not in self._cells:
+                self._cells[cell] = []
+            self._cells[cell].append(index)
+
+    def query(self, rect):
+        """
+        Returns all the items whose rectangles intersect the query rectangle.
+
+        :param rect: the query rectangle (x0, y0, x1, y1), inclusive
+        :type rect: tuple
+        :return: the items, in order of insertion
+        :rtype: list
+        """
+        indices = set()
+        for cell in self._cells_for(rect):
+            if cell in self._cells:
+                for index in self._cells[cell]:
+                    if rects_intersect(rect, self._entries[index][0]):
+                        indices.add(index)
+        return [self._entries[index][1] for index in sorted(indices)]
+
+    def intersects(self, rect):
+        """
+        Checks whether any stored rectangle intersects the query rectangle.
+
+        :param rect: the query rectangle (x0, y0, x1, y1), inclusive
+        :type rect: tuple
+        :return: True if at least one intersects
+        :rtype: bool
+        """
+        for cell in self._cells_for(rect):
+            if cell in self._cells:
+                for index in self._cells[cell]:
+                    if rects_intersect(rect, self._entries[index][0]):
+                        return True
+        return False
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,124 @@
+from xml.sax.saxutils import escape, quoteattr
+
+
+def svg_color(color):
+    """
+    Turns the RGB(A) tuple into an SVG color string (ignores alpha).
+
+    :param color: the color tuple
+    :type color: tuple
+    :return: the color string
+    :rtype: str
+    """
+    return "#%02x%02x%02x" % (int(color[0]), int(color[1]), int(color[2]))
+
+
+def svg_opacity(alpha):
+    """
+    Turns the 0-255 alpha value into an SVG opacity string.
+
+    :param alpha: the alpha value
+    :type alpha: int
+    :return: the opacity string
+    :rtype: str
+    """
+    return "%.3f" % (max(0, min(255, alpha)) / 255)
+
+
+def svg_polygon(points, outline, outline_alpha, thickness, fill=None, fill_alpha=0):
+    """
+    Generates an SVG polygon element.
+
+    :param points: the list of (x, y) tuples
+    :type points: list
+    :param outline: the RGB color of the outline
+    :type outline: tuple
+    :param outline_alpha: the alpha value of the outline
+    :type outline_alpha: int
+    :param thickness: the thickness of the outline, <1 for no outline
+    :type thickness: int
+    :param fill: the RGB color of the filling, None for no filling
+    :type fill: tuple
+    :param fill_alpha: the alpha value of the filling
+    :type fill_alpha: int
+    :return: the SVG element
+    :rtype: str
+    """
+    coords = " ".join(["%g,%g" % (x, y) for x, y in points])
+    if fill is None:
+        fill_attrs = 'fill="none"'
+    else:
+        fill_attrs = 'fill="%s" fill-opacity="%s"' % (svg_color(fill), svg_opacity(fill_alpha))
+    if thickness < 1:
+        stroke_attrs = 'stroke="none"'
+    else:
+        stroke_attrs = 'stroke="%s" stroke-opacity="%s" stroke-width="%d"' % (svg_color(outline), svg_opacity(outline_alpha), thickness)
+    return '<polygon points="%s" %s %s/>' % (coords, fill_attrs, stroke_attrs)
+
+
+def svg_rect(x, y, w, h, fill, fill_alpha=255):
+    """
+    Generates an SVG rectangle element.
+
+    :param x: the left coordinate
+    :type x: int
+    :param y: the top coordinate
+    :type y: int
+    :param w: the width
+    :type w: int
+    :param h: the height
+    :type h: int
+    :param fill: the RGB color of the rectangle
+    :type fill: tuple
+    :param fill_alpha: the alpha value of the rectangle
+    :type fill_alpha: int
+    :return: the SVG element
+    :rtype: str
+    """
+    return '<rect x="%g" y="%g" width="%g" height="%g" fill="%s" fill-opacity="%s"/>' \
+           % (x, y, w, h, svg_color(fill), svg_opacity(fill_alpha))
+
+
+def svg_text(x, y, text, color, font_family, font_size):
+    """
+    Generates an SVG text element, with x/y being the top-left corner.
+
+    :param x: the left coordinate
+    :type x: int
+    :param y: the top coordinate
+    :type y: int
+    :param text: the text to output
+    :type text: str
+    :param color: the RGB color of the text
+    :type color: tuple
+    :param font_family: the font family (any escaping backslashes get removed)
+    :type font_family: str
+    :param font_size: the size of the font
+    :type font_size: int
+    :return: the SVG element
+    :rtype: str
+    """
+    return '<text x="%g" y="%g" dominant-baseline="hanging" font-family=%s font-size="%d" fill="%s">%s</text>' \
+           % (x, y, quoteattr(font_family.replace("\\", "")), font_size, svg_color(color), escape(text))
+
+
+def svg_document(width, height, elements):
+    """
+    Assembles the SVG document.
+
+    :param width: the width of the image the layer is for
+    :type width: int
+    :param height: the height of the image the layer is for
+    :type height: int
+    :param elements: the SVG elements to add
+    :type elements: list
+    :return: the SVG document
+    :rtype: str
+    """
+    result = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" viewBox="0 0 %d %d">' % (width, height, width, height),
+    ]
+    result.extend(elements)
+    result.append('</svg>')
+    return "\n".join(result) + "\n"
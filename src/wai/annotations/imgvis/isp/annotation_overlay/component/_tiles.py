@@ -0,0 +1,37 @@
+import os
+
+
+def tile_boxes(width, height, tile_size):
+    """
+    Generates the boxes of the tiles that cover the image.
+
+    :param width: the width of the image
+    :type width: int
+    :param height: the height of the image
+    :type height: int
+    :param tile_size: the width/height of the tiles
+    :type tile_size: int
+    :return: the generator of (row, col, (x0, y0, x1, y1)) tuples, with x1/y1 being exclusive
+    """
+    for row, y in enumerate(range(0, height, tile_size)):
+        for col, x in enumerate(range(0, width, tile_size)):
+            yield row, col, (x, y, min(x + tile_size, width), min(y + tile_size, height))
+
+
+def tile_filename(output_dir, filename, row, col):
+    """
+    Generates the filename for the tile of an image.
+
+    :param output_dir: the directory to place the tile in
+    :type output_dir: str
+    :param filename: the filename of the image the tile belongs to
+    :type filename: str
+    :param row: the row of the tile
+    :type row: int
+    :param col: the column of the tile
+    :type col: int
+    :return: the filename of the tile
+    :rtype: str
+    """
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(output_dir, "%s-tile-%03d-%03d.png" % (name, row, col))
@@ -0,0 +1,33 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import ProcessorComponent
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import ProcessorStageSpecifier
+
+
+class AnnotationDiffODISPSpecifier(ProcessorStageSpecifier):
+    """
+    Specifies the annotation diff ISP (OD).
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Compares predictions (second of two consecutive elements with the same image) against the ground truth (first element), drawing true positives, false positives and false negatives in different colors."
+
+    @classmethod
+    def domain_transfer_function(
+            cls,
+            input_domain: Type[DomainSpecifier]
+    ) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.object_detection import ImageObjectDetectionDomainSpecifier
+        if input_domain is ImageObjectDetectionDomainSpecifier:
+            return input_domain
+        else:
+            raise Exception(
+                f"AnnotationDiffOD only handles the following domains: "
+                f"{ImageObjectDetectionDomainSpecifier.name()}"
+            )
+
+    @classmethod
+    def components(cls) -> Tuple[Type[ProcessorComponent]]:
+        from wai.annotations.imgvis.isp.annotation_overlay.component import AnnotationDiffOD
+        return AnnotationDiffOD,
@@ -1,3 +1,4 @@
+from ._AnnotationDiffODISPSpecifier import AnnotationDiffODISPSpecifier
 from ._AnnotationOverlayICISPSpecifier import AnnotationOverlayICISPSpecifier
 from ._AnnotationOverlayISISPSpecifier import AnnotationOverlayISISPSpecifier
 from ._AnnotationOverlayODISPSpecifier import AnnotationOverlayODISPSpecifier
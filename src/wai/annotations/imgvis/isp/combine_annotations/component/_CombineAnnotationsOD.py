@@ -1,21 +1,30 @@
+import numpy as np
+import shapely
+
+from concurrent.futures import ThreadPoolExecutor
 from shapely.geometry import Polygon, GeometryCollection, MultiPolygon
-from shapely.ops import unary_union
+from shapely.prepared import prep
 
-from wai.common.cli.options import TypedOption
-from wai.common.geometry import Polygon as WaiPolygon
-from wai.common.geometry import Point as WaiPoint
 from wai.common.adams.imaging.locateobjects import LocatedObjects, LocatedObject
+from wai.common.cli.options import TypedOption, FlagOption
 from wai.annotations.core.component import ProcessorComponent
 from wai.annotations.core.stream import ThenFunction, DoneFunction
-from wai.annotations.core.stream.util import RequiresNoFinalisation
 from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
-from wai.annotations.core.util import INTERSECT, COMBINATIONS, to_polygons, intersect_over_union
+from wai.annotations.core.util import UNION, INTERSECT, COMBINATIONS, to_polygons
+from wai.annotations.imgvis.isp.combine_annotations.component._store import AnnotationStore, AnnotationStoreBuilder
+from wai.annotations.imgvis.util import Checkpoint, find_matches, profiled, profiled_finish
 
 STREAM_INDEX = "stream_index"
 
+REDUCTION_SEQUENTIAL = "sequential"
+REDUCTION_TREE = "tree"
+REDUCTIONS = [
+    REDUCTION_SEQUENTIAL,
+    REDUCTION_TREE,
+]
+
 
 class CombineAnnotationsOD(
-    RequiresNoFinalisation,
     ProcessorComponent[ImageObjectDetectionInstance, ImageObjectDetectionInstance]
 ):
     """
@@ -36,71 +45,201 @@ class CombineAnnotationsOD(
         help="how to combine the annotations (%s); the '%s' key in the meta-data contains the stream index" % ("|".join(COMBINATIONS), STREAM_INDEX)
     )
 
+    precision_grid: float = TypedOption(
+        "--precision-grid",
+        type=float,
+        default=0.0,
+        help="the size of the grid to snap the polygon coordinates to before computing the IoU and combining them, e.g., 1 for whole pixels; speeds up the geometry operations and avoids slivers; <=0 to turn off"
+    )
+
+    simplify_tolerance: float = TypedOption(
+        "--simplify-tolerance",
+        type=float,
+        default=0.0,
+        help="the tolerance (in pixels) for simplifying the polygons (topology-preserving) before computing the IoU and combining them; <=0 to turn off"
+    )
+
+    reduction: str = TypedOption(
+        "--reduction",
+        type=str,
+        default=REDUCTION_SEQUENTIAL,
+        choices=REDUCTIONS,
+        help="how to combine the streams: %s folds each element into the annotations combined so far, "
+             "%s collects the annotations of consecutive elements with the same image filename (one per stream) and combines them pairwise in a tree, "
+             "forwarding a single element per image" % (REDUCTION_SEQUENTIAL, REDUCTION_TREE)
+    )
+
+    num_workers: int = TypedOption(
+        "--num-workers",
+        type=int,
+        default=1,
+        help="the number of threads to use for combining independent pairs of annotations in %s mode" % REDUCTION_TREE
+    )
+
+    checkpoint_file: str = TypedOption(
+        "--checkpoint-file",
+        type=str,
+        default="",
+        help="the file to periodically save the running annotations and the number of processed elements to, for resuming an interrupted job; ignored if empty"
+    )
+
+    checkpoint_interval: int = TypedOption(
+        "--checkpoint-interval",
+        type=int,
+        default=300,
+        help="the minimum number of seconds between saving checkpoints"
+    )
+
+    resume: bool = FlagOption(
+        "--resume",
+        help="whether to restore the state from the checkpoint file (if present), skipping the elements that were already processed"
+    )
+
+    def _to_polygons(self, located_objects):
+        """
+        Turns the located objects into shapely polygons, simplifying them and
+        snapping them to the precision grid if enabled.
+
+        :param located_objects: the objects to convert
+        :type located_objects: LocatedObjects
+        :return: the list of polygons
+        :rtype: list
+        """
+        return self._process_polygons(to_polygons(located_objects))
+
+    def _process_polygons(self, polygons):
+        """
+        Simplifies the polygons and snaps them to the precision grid if enabled.
+
+        :param polygons: the polygons to process
+        :type polygons: list
+        :return: the processed polygons
+        :rtype: list
+        """
+        result = polygons
+        if self.simplify_tolerance > 0:
+            result = [x.simplify(self.simplify_tolerance, preserve_topology=True) for x in result]
+        if self.precision_grid > 0:
+            result = [shapely.set_precision(x, self.precision_grid) for x in result]
+        return result
+
+    def _to_store(self, located_objects):
+        """
+        Turns the located objects into a columnar store.
+
+        :param located_objects: the objects to convert
+        :type located_objects: LocatedObjects
+        :return: the store
+        :rtype: AnnotationStore
+        """
+        return AnnotationStore.from_located_objects(located_objects, self._to_polygons(located_objects))
+
+    def _set_store(self, store):
+        """
+        Sets the running annotations, along with the prepared geometries
+        used for speeding up the comparisons.
+
+        :param store: the annotations
+        :type store: AnnotationStore
+        """
+        self._store = store
+        self._prepared = [prep(x) for x in store.polygons]
+
+    def _initialize_checkpoint(self):
+        """
+        Initializes the checkpointing, restoring the state if resuming.
+        """
+        self._processed = 0
+        self._skip = 0
+        self._checkpoint = None
+        if len(self.checkpoint_file) > 0:
+            self._checkpoint = Checkpoint(self.checkpoint_file, self.checkpoint_interval)
+            if self.resume:
+                state = self._checkpoint.load()
+                if state is not None:
+                    self._restore_state(state)
+                    self.logger.info("Resuming from checkpoint, skipping %d elements" % self._skip)
+
+    def _get_state(self):
+        """
+        Assembles the state to checkpoint: the number of processed elements
+        and, in sequential mode, the running annotations (as plain tuples and
+        WKB-encoded polygons) and the stream index. In tree mode, the elements
+        of the group that hasn't been combined yet don't count as processed.
+
+        :return: the state
+        :rtype: dict
+        """
+        result = {"count": self._processed}
+        if hasattr(self, "_group"):
+            result["count"] -= len(self._group)
+        if hasattr(self, "_store"):
+            result["objects"] = [(lobj.x, lobj.y, lobj.width, lobj.height, dict(lobj.metadata))
+                                 for lobj in self._store.to_located_objects()]
+            result["polygons"] = shapely.to_wkb(self._store.polygons).tolist()
+            result["float_coords"] = self._store.float_coords.tolist()
+            result["stream_index"] = self._stream_index
+        return result
+
+    def _restore_state(self, state):
+        """
+        Restores the state from a checkpoint.
+
+        :param state: the state to restore
+        :type state: dict
+        """
+        self._processed = state["count"]
+        self._skip = state["count"]
+        if "objects" in state:
+            located_objects = LocatedObjects([LocatedObject(x, y, w, h, **metadata) for x, y, w, h, metadata in state["objects"]])
+            polygons = list(shapely.from_wkb(state["polygons"])) if (len(state["polygons"]) > 0) else []
+            self._set_store(AnnotationStore.from_located_objects(located_objects, polygons, state.get("float_coords")))
+            self._stream_index = state["stream_index"]
+
     def _find_matches(self, polygons_old, polygons_new):
         """
         Finds the matches between the old and new annotations.
 
-        :param polygons_old: the old annotations
+        :param polygons_old: the old annotations, prepared geometries
         :type polygons_old: list
         :param polygons_new: the new annotations
         :type polygons_new: list
-        :return: the matches, list of old/new index tuples (an index of -1 means no match found)
+        :return: the matches, list of old/new index/IoU tuples (an index of -1 means no match found)
         :rtype: list
         """
-        result = []
-        match_new = set([x for x in range(len(polygons_new))])
-        match_old = set([x for x in range(len(polygons_old))])
-        for n, poly_new in enumerate(polygons_new):
-            for o, poly_old in enumerate(polygons_old):
-                iou = intersect_over_union(poly_new, poly_old)
-                if iou > 0:
-                    if iou >= self.min_iou:
-                        if n in match_new:
-                            match_new.remove(n)
-                        if o in match_old:
-                            match_old.remove(o)
-                        result.append((o, n, iou))
-
-        # add old polygons that had no match
-        for o in match_old:
-            result.append((o, -1, 0.0))
-
-        # add new polygons that had no match
-        for n in match_new:
-            result.append((-1, n, 0.0))
+        return find_matches(polygons_old, polygons_new, self.min_iou)
 
-        return result
-
-    def process_element(
-            self,
-            element: ImageObjectDetectionInstance,
-            then: ThenFunction[ImageObjectDetectionInstance],
-            done: DoneFunction
-    ):
-        if not hasattr(self, "_annotations"):
-            self._annotations = element.annotations
-            self._stream_index = 0
-            then(element)
-            return
-
-        self._stream_index += 1
+    def _combine(self, store_old, prepared_old, store_new, stream_index):
+        """
+        Combines two sets of annotations.
 
-        # combine annotations
-        polygons_old = to_polygons(self._annotations)
-        polygons_new = to_polygons(element.annotations)
-        matches = self._find_matches(polygons_old, polygons_new)
-        combined = []
+        :param store_old: the old annotations
+        :type store_old: AnnotationStore
+        :param prepared_old: the prepared geometries of the old annotations
+        :type prepared_old: list
+        :param store_new: the new annotations
+        :type store_new: AnnotationStore
+        :param stream_index: the stream index to store in the meta-data of combined objects
+        :type stream_index: int
+        :return: the combined annotations
+        :rtype: AnnotationStore
+        """
+        grid_size = self.precision_grid if self.precision_grid > 0 else None
+        polygons_old = store_old.polygons
+        polygons_new = store_new.polygons
+        matches = self._find_matches(prepared_old, polygons_new)
+        combined = AnnotationStoreBuilder()
         for o, n, iou in matches:
             if o == -1:
-                combined.append(element.annotations[n])
+                combined.add_from(store_new, n)
             elif n == -1:
-                combined.append(self._annotations[o])
+                combined.add_from(store_old, o)
             else:
                 # combine polygons
                 if self.combination == UNION:
-                    poly_comb = unary_union([polygons_new[n], polygons_old[o]])
+                    poly_comb = shapely.union_all([polygons_new[n], polygons_old[o]], grid_size=grid_size)
                 elif self.combination == INTERSECT:
-                    poly_comb = polygons_new[n].intersection(polygons_old[o])
+                    poly_comb = polygons_new[n].intersection(polygons_old[o], grid_size=grid_size)
                 else:
                     raise Exception("Unknown combination method: %s" % self.combination)
                 # grab the first polygon
@@ -116,20 +255,127 @@ class CombineAnnotationsOD(
                             break
 
                 if isinstance(poly_comb, Polygon):
-                    # create new located object
+                    # add new object
                     minx, miny, maxx, maxy = [int(x) for x in poly_comb.bounds]
-                    x_list, y_list = poly_comb.exterior.coords.xy
-                    points = []
-                    for i in range(len(x_list)):
-                        points.append(WaiPoint(x=x_list[i], y=y_list[i]))
-                    lobj = LocatedObject(minx, miny, maxx - minx + 1, maxy - miny + 1)
-                    lobj.set_polygon(WaiPolygon(*points))
-                    lobj.metadata[STREAM_INDEX] = self._stream_index
-                    combined.append(lobj)
+                    coords = np.asarray(poly_comb.exterior.coords, dtype=np.float64)[:, :2]
+                    # the polygon used for further matching uses the rounded coordinates,
+                    # just like the polygon of an object parsed from annotations
+                    polygon = self._process_polygons([Polygon(np.round(coords))])[0]
+                    combined.add((minx, miny, maxx - minx + 1, maxy - miny + 1, np.nan), coords,
+                                 {STREAM_INDEX: stream_index}, polygon, True)
                 else:
                     self.logger.warning("Unhandled geometry type returned from combination, skipping: %s" % str(type(poly_comb)))
 
-        self._annotations = LocatedObjects(combined)
+        return combined.build()
+
+    def _combine_pair(self, first, second):
+        """
+        Combines two (annotations, stream index) tuples of the tree reduction.
+
+        :param first: the first tuple
+        :type first: tuple
+        :param second: the second tuple
+        :type second: tuple
+        :return: the combined tuple, using the stream index of the second one
+        :rtype: tuple
+        """
+        store_old, _ = first
+        store_new, stream_index = second
+        prepared_old = [prep(x) for x in store_old.polygons]
+        return self._combine(store_old, prepared_old, store_new, stream_index), stream_index
+
+    def _reduce_group(self, then: ThenFunction[ImageObjectDetectionInstance]):
+        """
+        Combines the collected annotations of the current image by pairwise
+        tree reduction and forwards the result.
 
-        # new element
-        then(element.__class__(element.data, self._annotations))
+        :param then: the function for forwarding the combined element
+        :type then: ThenFunction
+        """
+        level = [(self._to_store(element.annotations), i) for i, element in enumerate(self._group)]
+        while len(level) > 1:
+            pairs = [(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+            if self._executor is None:
+                reduced = [self._combine_pair(first, second) for first, second in pairs]
+            else:
+                reduced = list(self._executor.map(lambda pair: self._combine_pair(*pair), pairs))
+            # odd one out moves up a level unchanged
+            if len(level) % 2 == 1:
+                reduced.append(level[-1])
+            level = reduced
+
+        element = self._group[0]
+        self._group = []
+        then(element.__class__(element.data, level[0][0].to_located_objects()))
+
+    def _process_tree(
+            self,
+            element: ImageObjectDetectionInstance,
+            then: ThenFunction[ImageObjectDetectionInstance]
+    ):
+        """
+        Collects the elements of an image, combining them once the next image arrives.
+
+        :param element: the element to process
+        :type element: ImageObjectDetectionInstance
+        :param then: the function for forwarding the combined elements
+        :type then: ThenFunction
+        """
+        if not hasattr(self, "_group"):
+            self._group = []
+            self._executor = None
+            if self.num_workers > 1:
+                self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+
+        if (len(self._group) > 0) and (self._group[0].data.filename != element.data.filename):
+            self._reduce_group(then)
+        self._group.append(element)
+
+    @profiled
+    def process_element(
+            self,
+            element: ImageObjectDetectionInstance,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if not hasattr(self, "_processed"):
+            self._initialize_checkpoint()
+
+        # already processed before resuming?
+        if self._skip > 0:
+            self._skip -= 1
+            return
+        self._processed += 1
+
+        if self.reduction == REDUCTION_TREE:
+            self._process_tree(element, then)
+        elif not hasattr(self, "_store"):
+            self._set_store(self._to_store(element.annotations))
+            self._stream_index = 0
+            then(element)
+        else:
+            self._stream_index += 1
+
+            # combine annotations
+            self._set_store(self._combine(self._store, self._prepared, self._to_store(element.annotations), self._stream_index))
+
+            # new element
+            then(element.__class__(element.data, self._store.to_located_objects()))
+
+        if (self._checkpoint is not None) and self._checkpoint.due():
+            self._checkpoint.save(self._get_state())
+
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageObjectDetectionInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_group"):
+            if len(self._group) > 0:
+                self._reduce_group(then)
+            if self._executor is not None:
+                self._executor.shutdown()
+        if hasattr(self, "_processed") and (self._checkpoint is not None):
+            self._checkpoint.save(self._get_state())
+        done()
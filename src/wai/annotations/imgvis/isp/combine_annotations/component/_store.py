@@ -0,0 +1,225 @@
+import numpy as np
+
+from wai.common.adams.imaging.locateobjects import LocatedObjects, LocatedObject, constants
+
+SCORE_KEY = "score"
+
+BOX_DTYPE = np.dtype([
+    ("x", np.int32),
+    ("y", np.int32),
+    ("width", np.int32),
+    ("height", np.int32),
+    ("score", np.float64),
+])
+
+
+def _score(metadata):
+    """
+    Returns the score stored in the meta-data.
+
+    :param metadata: the meta-data to get the score from
+    :type metadata: dict
+    :return: the score, NaN if not present or not numeric
+    :rtype: float
+    """
+    try:
+        return float(metadata[SCORE_KEY])
+    except:
+        return np.nan
+
+
+def _coords(lobj):
+    """
+    Parses the polygon of the located object.
+
+    :param lobj: the object to get the polygon from
+    :type lobj: LocatedObject
+    :return: the (N, 2) array of coordinates, empty if no polygon
+    :rtype: np.ndarray
+    """
+    if not lobj.has_polygon():
+        return np.empty((0, 2), dtype=np.float64)
+    result = np.empty((len(lobj.metadata[constants.KEY_POLY_X].split(",")), 2), dtype=np.float64)
+    result[:, 0] = lobj.metadata[constants.KEY_POLY_X].split(",")
+    result[:, 1] = lobj.metadata[constants.KEY_POLY_Y].split(",")
+    return result
+
+
+def _format_coords(values, as_float):
+    """
+    Turns the coordinates into a comma-separated string.
+
+    :param values: the coordinates to format
+    :type values: np.ndarray
+    :param as_float: whether to write all values as floats (computed coordinates) or
+                     integral values without decimals (as they were in the original annotations)
+    :type as_float: bool
+    :return: the string
+    :rtype: str
+    """
+    if as_float:
+        return ",".join(str(v) for v in values.tolist())
+    return ",".join(str(int(v)) if v.is_integer() else str(v) for v in values.tolist())
+
+
+class AnnotationStore(object):
+    """
+    Columnar representation of object detection annotations: a structured
+    array for the boxes/scores, a flat vertex buffer with offsets for the
+    polygons and the remaining meta-data. Also holds the shapely polygons
+    used for matching. Located objects only get created when requested and
+    aren't kept, i.e., each request returns new objects.
+    """
+
+    def __init__(self, boxes, vertices, offsets, float_coords, metadata, polygons):
+        """
+        Initializes the store.
+
+        :param boxes: the structured array of boxes (see BOX_DTYPE)
+        :type boxes: np.ndarray
+        :param vertices: the (N, 2) array of all the polygon vertices
+        :type vertices: np.ndarray
+        :param offsets: the offsets of the polygons in the vertex buffer (one more than boxes)
+        :type offsets: np.ndarray
+        :param float_coords: whether the polygon coordinates of the objects get written as floats
+        :type float_coords: np.ndarray
+        :param metadata: the meta-data (without the polygon) of the objects
+        :type metadata: list
+        :param polygons: the shapely polygons of the objects
+        :type polygons: list
+        """
+        self.boxes = boxes
+        self.vertices = vertices
+        self.offsets = offsets
+        self.float_coords = float_coords
+        self.metadata = metadata
+        self.polygons = polygons
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def coords(self, index):
+        """
+        Returns the polygon coordinates of the object.
+
+        :param index: the index of the object
+        :type index: int
+        :return: the (N, 2) array of coordinates (view on the vertex buffer)
+        :rtype: np.ndarray
+        """
+        return self.vertices[self.offsets[index]:self.offsets[index + 1]]
+
+    @classmethod
+    def from_located_objects(cls, located_objects, polygons, float_coords=None):
+        """
+        Creates a store from the located objects.
+
+        :param located_objects: the objects to store
+        :type located_objects: LocatedObjects
+        :param polygons: the corresponding shapely polygons
+        :type polygons: list
+        :param float_coords: whether to write the polygon coordinates of the objects as floats, None for none
+        :type float_coords: list
+        :return: the store
+        :rtype: AnnotationStore
+        """
+        if float_coords is None:
+            float_coords = [False] * len(located_objects)
+        builder = AnnotationStoreBuilder()
+        for lobj, polygon, as_float in zip(located_objects, polygons, float_coords):
+            metadata = dict(lobj.metadata)
+            metadata.pop(constants.KEY_POLY_X, None)
+            metadata.pop(constants.KEY_POLY_Y, None)
+            builder.add((lobj.x, lobj.y, lobj.width, lobj.height, _score(metadata)), _coords(lobj), metadata, polygon, as_float)
+        return builder.build()
+
+    def located_object(self, index):
+        """
+        Creates a new located object for the object.
+
+        :param index: the index of the object
+        :type index: int
+        :return: the located object
+        :rtype: LocatedObject
+        """
+        box = self.boxes[index]
+        result = LocatedObject(int(box["x"]), int(box["y"]), int(box["width"]), int(box["height"]))
+        result.metadata.update(self.metadata[index])
+        coords = self.coords(index)
+        if len(coords) > 0:
+            as_float = bool(self.float_coords[index])
+            result.metadata[constants.KEY_POLY_X] = _format_coords(coords[:, 0], as_float)
+            result.metadata[constants.KEY_POLY_Y] = _format_coords(coords[:, 1], as_float)
+        return result
+
+    def to_located_objects(self):
+        """
+        Converts the store into (new) located objects.
+
+        :return: the objects
+        :rtype: LocatedObjects
+        """
+        return LocatedObjects([self.located_object(i) for i in range(len(self))])
+
+
+class AnnotationStoreBuilder(object):
+    """
+    Collects rows and assembles the arrays of a store in one go.
+    """
+
+    def __init__(self):
+        self._boxes = []
+        self._coords = []
+        self._float_coords = []
+        self._metadata = []
+        self._polygons = []
+
+    def add(self, box, coords, metadata, polygon, float_coords=False):
+        """
+        Adds an object.
+
+        :param box: the (x, y, width, height, score) tuple
+        :type box: tuple
+        :param coords: the (N, 2) array of polygon coordinates
+        :type coords: np.ndarray
+        :param metadata: the meta-data (without the polygon)
+        :type metadata: dict
+        :param polygon: the shapely polygon
+        :type polygon: Polygon
+        :param float_coords: whether to write the polygon coordinates as floats
+        :type float_coords: bool
+        """
+        self._boxes.append(box)
+        self._coords.append(coords)
+        self._float_coords.append(float_coords)
+        self._metadata.append(metadata)
+        self._polygons.append(polygon)
+
+    def add_from(self, store, index):
+        """
+        Adds an object from another store.
+
+        :param store: the store to copy the object from
+        :type store: AnnotationStore
+        :param index: the index of the object
+        :type index: int
+        """
+        self.add(tuple(store.boxes[index].tolist()), store.coords(index), store.metadata[index], store.polygons[index],
+                 bool(store.float_coords[index]))
+
+    def build(self):
+        """
+        Assembles the store.
+
+        :return: the store
+        :rtype: AnnotationStore
+        """
+        boxes = np.array(self._boxes, dtype=BOX_DTYPE)
+        offsets = np.zeros(len(self._coords) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(x) for x in self._coords], dtype=np.int64)
+        if len(self._coords) > 0:
+            vertices = np.concatenate(self._coords).astype(np.float64, copy=False)
+        else:
+            vertices = np.empty((0, 2), dtype=np.float64)
+        float_coords = np.array(self._float_coords, dtype=np.bool_)
+        return AnnotationStore(boxes, vertices, offsets, float_coords, self._metadata, self._polygons)
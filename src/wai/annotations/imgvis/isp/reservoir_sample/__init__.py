@@ -0,0 +1,3 @@
+"""
+Package for the reservoir-sample ISP.
+"""
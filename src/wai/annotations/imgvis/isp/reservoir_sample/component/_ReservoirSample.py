@@ -0,0 +1,123 @@
+import math
+import random
+
+from wai.common.cli.options import TypedOption
+from wai.annotations.core.component import ProcessorComponent
+from wai.annotations.core.stream import ThenFunction, DoneFunction
+from wai.annotations.domain.image import Image, ImageInstance
+from wai.annotations.imgvis.util import profiled, profiled_finish
+
+
+class ReservoirSample(
+    ProcessorComponent[ImageInstance, ImageInstance]
+):
+    """
+    Stream processor that keeps a uniform random sample of fixed size of the
+    elements passing through (reservoir sampling, algorithm L), using bounded
+    memory. Only the image bytes and annotations of the sampled elements get
+    stored. The sample gets forwarded in stream order at the end of the stream,
+    so that any expensive processing downstream only happens for the sample.
+    """
+
+    num_samples: int = TypedOption(
+        "-n", "--num-samples",
+        type=int,
+        default=500,
+        help="the size of the sample to keep"
+    )
+
+    seed: int = TypedOption(
+        "--seed",
+        type=int,
+        default=None,
+        help="the seed for the random number generator, for reproducible samples"
+    )
+
+    def _initialize(self):
+        """
+        Initializes the reservoir.
+        """
+        self._random = random.Random(self.seed)
+        self._reservoir = []
+        self._count = 0
+        self._weight = 1.0
+        self._next = 0
+        if self.num_samples > 0:
+            self._weight = self._draw_weight()
+            self._next = self._draw_next()
+
+    def _draw_weight(self):
+        """
+        Updates the weight used for determining the gaps between the selected elements.
+
+        :return: the new weight
+        :rtype: float
+        """
+        return self._weight * math.exp(math.log(1.0 - self._random.random()) / self.num_samples)
+
+    def _draw_next(self):
+        """
+        Determines the (0-based) stream position of the next element to select
+        once the reservoir is full.
+
+        :return: the position
+        :rtype: int
+        """
+        start = max(self._count, self.num_samples)
+        if self._weight >= 1.0:
+            return start
+        return start + int(math.floor(math.log(1.0 - self._random.random()) / math.log1p(-self._weight)))
+
+    def _strip(self, element: ImageInstance):
+        """
+        Creates a copy of the element that only holds the image bytes and the
+        annotations, i.e., no decoded image.
+
+        :param element: the element to copy
+        :type element: ImageInstance
+        :return: the copy
+        :rtype: ImageInstance
+        """
+        img = element.data
+        return element.__class__(Image(img.filename, img.data, img.format, img.size), element.annotations)
+
+    @profiled
+    def process_element(
+            self,
+            element: ImageInstance,
+            then: ThenFunction[ImageInstance],
+            done: DoneFunction
+    ):
+        if not hasattr(self, "_reservoir"):
+            self._initialize()
+
+        if self.num_samples < 1:
+            return
+
+        index = self._count
+        self._count += 1
+
+        # fill the reservoir
+        if len(self._reservoir) < self.num_samples:
+            self._reservoir.append((index, self._strip(element)))
+            return
+
+        # skip elements until the next selected one
+        if index < self._next:
+            return
+
+        self._reservoir[self._random.randrange(self.num_samples)] = (index, self._strip(element))
+        self._weight = self._draw_weight()
+        self._next = self._draw_next()
+
+    @profiled_finish
+    def finish(
+            self,
+            then: ThenFunction[ImageInstance],
+            done: DoneFunction
+    ):
+        if hasattr(self, "_reservoir"):
+            for index, element in sorted(self._reservoir, key=lambda x: x[0]):
+                then(element)
+            self._reservoir = []
+        done()
@@ -0,0 +1 @@
+from ._ReservoirSample import ReservoirSample
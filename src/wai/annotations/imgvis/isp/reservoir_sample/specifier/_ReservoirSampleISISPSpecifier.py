@@ -0,0 +1,33 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import ProcessorComponent
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import ProcessorStageSpecifier
+
+
+class ReservoirSampleISISPSpecifier(ProcessorStageSpecifier):
+    """
+    Specifies the reservoir-sample ISP (IS).
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Keeps a uniform random sample of fixed size of the image segmentation images passing through, which gets forwarded at the end of the stream."
+
+    @classmethod
+    def domain_transfer_function(
+            cls,
+            input_domain: Type[DomainSpecifier]
+    ) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.segmentation import ImageSegmentationDomainSpecifier
+        if input_domain is ImageSegmentationDomainSpecifier:
+            return input_domain
+        else:
+            raise Exception(
+                f"ReservoirSampleIS only handles the following domains: "
+                f"{ImageSegmentationDomainSpecifier.name()}"
+            )
+
+    @classmethod
+    def components(cls) -> Tuple[Type[ProcessorComponent]]:
+        from wai.annotations.imgvis.isp.reservoir_sample.component import ReservoirSample
+        return ReservoirSample,
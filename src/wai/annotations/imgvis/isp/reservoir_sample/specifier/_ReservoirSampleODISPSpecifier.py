@@ -0,0 +1,33 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import ProcessorComponent
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import ProcessorStageSpecifier
+
+
+class ReservoirSampleODISPSpecifier(ProcessorStageSpecifier):
+    """
+    Specifies the reservoir-sample ISP (OD).
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Keeps a uniform random sample of fixed size of the object detection images passing through, which gets forwarded at the end of the stream."
+
+    @classmethod
+    def domain_transfer_function(
+            cls,
+            input_domain: Type[DomainSpecifier]
+    ) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.object_detection import ImageObjectDetectionDomainSpecifier
+        if input_domain is ImageObjectDetectionDomainSpecifier:
+            return input_domain
+        else:
+            raise Exception(
+                f"ReservoirSampleOD only handles the following domains: "
+                f"{ImageObjectDetectionDomainSpecifier.name()}"
+            )
+
+    @classmethod
+    def components(cls) -> Tuple[Type[ProcessorComponent]]:
+        from wai.annotations.imgvis.isp.reservoir_sample.component import ReservoirSample
+        return ReservoirSample,
@@ -0,0 +1,3 @@
+from ._ReservoirSampleICISPSpecifier import ReservoirSampleICISPSpecifier
+from ._ReservoirSampleISISPSpecifier import ReservoirSampleISISPSpecifier
+from ._ReservoirSampleODISPSpecifier import ReservoirSampleODISPSpecifier
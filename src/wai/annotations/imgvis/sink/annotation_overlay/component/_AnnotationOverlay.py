@@ -1,10 +1,13 @@
 import io
+import os
+import re
 from PIL import Image, ImageDraw
 
 from wai.annotations.core.component import SinkComponent
 from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
 
-from wai.common.cli.options import TypedOption
+from wai.common.cli.options import TypedOption, FlagOption
+from wai.annotations.imgvis.util import Checkpoint, object_vertices, profiled, profiled_finish, scale_polygon
 
 
 class AnnotationOverlay(
@@ -36,67 +39,235 @@ class AnnotationOverlay(
         "-o", "--output",
         type=str,
         default="./overlay.png",
-        help="the PNG image to write the generated overlay to"
+        help="the PNG image to write the generated overlay to; in per-label mode, the label gets appended to the name, e.g.: ./overlay-LABEL.png"
     )
 
+    per_label: bool = FlagOption(
+        "--per-label",
+        help="whether to generate a separate overlay for each label (in a single pass)"
+    )
+
+    label_key: str = TypedOption(
+        "--label-key",
+        type=str,
+        default="type",
+        help="the key in the meta-data that contains the label, used in per-label mode"
+    )
+
+    lod_tolerance: float = TypedOption(
+        "--lod-tolerance",
+        type=float,
+        default=0.0,
+        help="the level-of-detail tolerance in overlay pixels: consecutive polygon vertices that fall into the same cell of a grid with this cell size get merged before drawing; <=0 to turn off"
+    )
+
+    checkpoint_file: str = TypedOption(
+        "--checkpoint-file",
+        type=str,
+        default="",
+        help="the file to periodically save the overlay(s) and the number of processed elements to, for resuming an interrupted job; ignored if empty"
+    )
+
+    checkpoint_interval: int = TypedOption(
+        "--checkpoint-interval",
+        type=int,
+        default=300,
+        help="the minimum number of seconds between saving checkpoints"
+    )
+
+    resume: bool = FlagOption(
+        "--resume",
+        help="whether to restore the overlay(s) from the checkpoint file (if present), skipping the elements that were already processed"
+    )
+
+    def _initialize(self, size):
+        """
+        Initializes the colors and the (empty) canvases.
+
+        :param size: the size of the first image
+        :type size: tuple
+        """
+        self._scale_to = None
+        if len(self.scale_to) > 0:
+            self._scale_to = [int(x) for x in self.scale_to.split(",")]
+            if len(self._scale_to) != 2:
+                self.logger.error("'--scale-to' option requires format 'width,height' but received: %s" % self.scale_to)
+                self._scale_to = None
+        self._color = tuple([int(x) for x in self.color.split(",")])
+        self._background_color = tuple([int(x) for x in self.background_color.split(",")])
+        self._size = tuple(size) if (self._scale_to is None) else tuple(self._scale_to)
+        self._canvases = dict()
+
+    def _initialize_checkpoint(self):
+        """
+        Initializes the checkpointing, restoring the overlay(s) if resuming.
+        """
+        self._processed = 0
+        self._skip = 0
+        self._checkpoint = None
+        if len(self.checkpoint_file) > 0:
+            self._checkpoint = Checkpoint(self.checkpoint_file, self.checkpoint_interval)
+            if self.resume:
+                state = self._checkpoint.load()
+                if state is not None:
+                    self._restore_state(state)
+                    self.logger.info("Resuming from checkpoint, skipping %d elements" % self._skip)
+
+    def _get_state(self):
+        """
+        Assembles the state to checkpoint: the number of processed elements,
+        the size and the overlay(s) as (fast-compressed) PNG.
+
+        :return: the state
+        :rtype: dict
+        """
+        result = {"count": self._processed}
+        if hasattr(self, "_canvases"):
+            result["size"] = self._size
+            result["canvases"] = dict()
+            for label, (overlay, _) in self._canvases.items():
+                data = io.BytesIO()
+                overlay.save(data, format="PNG", compress_level=1)
+                result["canvases"][label] = data.getvalue()
+        return result
+
+    def _restore_state(self, state):
+        """
+        Restores the state from a checkpoint.
+
+        :param state: the state to restore
+        :type state: dict
+        """
+        self._processed = state["count"]
+        self._skip = state["count"]
+        if "size" in state:
+            self._initialize(state["size"])
+            self._size = tuple(state["size"])
+            for label, data in state["canvases"].items():
+                overlay = Image.open(io.BytesIO(data))
+                overlay.load()
+                self._canvases[label] = (overlay, ImageDraw.Draw(overlay))
+
+    def _label_files(self):
+        """
+        Generates the output files for the overlays of the labels. Labels that
+        end up with the same filename (e.g., "a/b" and "a_b") get disambiguated
+        with a numeric suffix, e.g.: ./overlay-a_b-2.png (labels that can be used
+        as is take precedence).
+
+        :return: the dictionary of label (None if not in per-label mode) and filename
+        :rtype: dict
+        """
+        result = dict()
+        used = set()
+        name, ext = os.path.splitext(self.output_file)
+        bases = {x: None if x is None else re.sub(r"[^\w.-]", "_", str(x)) for x in self._canvases.keys()}
+        for label in sorted(bases.keys(), key=lambda x: (False, "") if x is None else (bases[x] != str(x), str(x))):
+            if label is None:
+                result[label] = self.output_file
+                continue
+            base = "%s-%s" % (name, bases[label])
+            filename = base + ext
+            suffix = 2
+            while filename in used:
+                filename = "%s-%d%s" % (base, suffix, ext)
+                suffix += 1
+            if suffix > 2:
+                self.logger.warning("Filename for label '%s' already in use, writing overlay to: %s" % (str(label), filename))
+            used.add(filename)
+            result[label] = filename
+        return result
+
+    def _canvas(self, label):
+        """
+        Returns the draw context of the canvas for the label, creating the canvas if necessary.
+
+        :param label: the label, None if not in per-label mode
+        :type label: str
+        :return: the draw context
+        :rtype: ImageDraw
+        """
+        if label not in self._canvases:
+            overlay = Image.new('RGBA', self._size, self._background_color)
+            self._canvases[label] = (overlay, ImageDraw.Draw(overlay))
+        return self._canvases[label][1]
+
     def output_overlay(self):
         """
-        Outputs the overlay image.
+        Outputs the overlay image(s).
         """
-        if hasattr(self, "_overlay"):
-            self._overlay.save(self.output_file, format="PNG")
+        if hasattr(self, "_canvases") and (len(self._canvases) > 0):
+            files = self._label_files()
+            for label, (overlay, _) in self._canvases.items():
+                overlay.save(files[label], format="PNG")
         else:
             print("No overlay generated!")
 
+    @profiled
     def consume_element(self, element: ImageObjectDetectionInstance):
         """
         Consumes instances.
         """
+        if not hasattr(self, "_processed"):
+            self._initialize_checkpoint()
+
+        # already processed before resuming?
+        if self._skip > 0:
+            self._skip -= 1
+            return
+        self._processed += 1
+
         img = Image.open(io.BytesIO(element.data.data))
 
-        if not hasattr(self, "_overlay"):
-            self._scale_to = None
-            if len(self.scale_to) > 0:
-                self._scale_to = [int(x) for x in self.scale_to.split(",")]
-                if len(self._scale_to) != 2:
-                    self.logger.error("'--scale-to' option requires format 'width,height' but received: %s" % self.scale_to)
-                    self._scale_to = None
-            # initialize overlay
-            self._color = tuple([int(x) for x in self.color.split(",")])
-            self._background_color = tuple([int(x) for x in self.background_color.split(",")])
-            self._overlay = Image.new('RGBA', img.size if (self._scale_to is None) else self._scale_to, self._background_color)
+        if not hasattr(self, "_canvases"):
+            # initialize overlay(s)
+            self._initialize(img.size)
+            if not self.per_label:
+                self._canvas(None)
         else:
-            # do we have to make the overlay larger?
+            # do we have to make the overlay(s) larger?
             if self._scale_to is None:
-                if (img.size[0] > self._overlay.size[0]) or (img.size[1] > self._overlay.size[1]):
-                    new_size = (max(img.size[0], self._overlay.size[0]), max(img.size[1], self._overlay.size[1]))
-                    tmp = Image.new('RGBA', new_size, self._background_color)
-                    tmp.paste(self._overlay, (0, 0))
-                    self._overlay = tmp
+                if (img.size[0] > self._size[0]) or (img.size[1] > self._size[1]):
+                    self._size = (max(img.size[0], self._size[0]), max(img.size[1], self._size[1]))
+                    for label, (overlay, _) in list(self._canvases.items()):
+                        tmp = Image.new('RGBA', self._size, self._background_color)
+                        tmp.paste(overlay, (0, 0))
+                        self._canvases[label] = (tmp, ImageDraw.Draw(tmp))
 
         if self._scale_to is None:
             scale_x = 1.0
             scale_y = 1.0
         else:
-            scale_x = self._overlay.size[0] / img.size[0]
-            scale_y = self._overlay.size[1] / img.size[1]
-
-        for lobj in element.annotations:
-            points = []
-            if lobj.has_polygon():
-                poly_x = lobj.get_polygon_x()
-                poly_y = lobj.get_polygon_y()
-                for x, y in zip(poly_x, poly_y):
-                    points.append((int(x * scale_x), int(y * scale_y)))
-            else:
-                rect = lobj.get_rectangle()
-                points.append((int(rect.left() * scale_x), int(rect.top() * scale_y)))
-                points.append((int(rect.right() * scale_x), int(rect.top() * scale_y)))
-                points.append((int(rect.right() * scale_x), int(rect.bottom() * scale_y)))
-                points.append((int(rect.left() * scale_x), int(rect.bottom() * scale_y)))
-
-            draw = ImageDraw.Draw(self._overlay)
-            draw.polygon(tuple(points), outline=self._color)
+            scale_x = self._size[0] / img.size[0]
+            scale_y = self._size[1] / img.size[1]
+
+        # determine canvas per object
+        if self.per_label:
+            draws = [self._canvas(lobj.metadata.get(self.label_key, "object")) for lobj in element.annotations]
+        else:
+            draws = [self._canvas(None)] * len(element.annotations)
+
+        # scale all the vertices of the element in one go
+        vertices, offsets = object_vertices(element.annotations)
+        if (scale_x != 1.0) or (scale_y != 1.0):
+            vertices *= (scale_x, scale_y)
+        if self.lod_tolerance > 0:
+            for i in range(len(offsets) - 1):
+                points = vertices[offsets[i]:offsets[i + 1]]
+                points = scale_polygon(points[:, 0], points[:, 1], tolerance=self.lod_tolerance)
+                draws[i].polygon(points.astype(int).ravel().tolist(), outline=self._color)
+        else:
+            # flat list of x/y values, offsets of the objects need doubling
+            coords = vertices.astype(int).ravel().tolist()
+            offsets = (offsets * 2).tolist()
+            for i in range(len(offsets) - 1):
+                draws[i].polygon(coords[offsets[i]:offsets[i + 1]], outline=self._color)
+
+        if (self._checkpoint is not None) and self._checkpoint.due():
+            self._checkpoint.save(self._get_state())
 
+    @profiled_finish
     def finish(self):
+        if hasattr(self, "_processed") and (self._checkpoint is not None):
+            self._checkpoint.save(self._get_state())
         self.output_overlay()
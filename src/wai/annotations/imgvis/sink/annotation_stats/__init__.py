@@ -0,0 +1,3 @@
+"""
+Package for the annotation_stats sink.
+"""
@@ -0,0 +1,261 @@
+import io
+import os
+import re
+import numpy as np
+from PIL import Image
+
+from wai.annotations.core.component import SinkComponent
+from wai.annotations.domain.image.object_detection import ImageObjectDetectionInstance
+
+from wai.common.cli.options import TypedOption
+from wai.annotations.imgvis.util import profiled, profiled_finish
+from wai.annotations.imgvis.sink.annotation_stats.component._plots import heatmap_plot, bar_plot
+
+
+class AnnotationStats(
+    SinkComponent[ImageObjectDetectionInstance]
+):
+    """
+    Sink that accumulates per-label statistics of the bounding boxes (size and
+    center relative to the image, aspect ratio) in fixed-size histograms, which
+    get updated with each element. Memory therefore only depends on the number
+    of bins and labels, not on the number of images or objects. The plots get
+    generated once all elements have been consumed.
+    """
+
+    output_dir: str = TypedOption(
+        "-o", "--output-dir",
+        type=str,
+        default=".",
+        help="the directory to write the plots (PNG) and the histograms (NPZ) to"
+    )
+
+    prefix: str = TypedOption(
+        "--prefix",
+        type=str,
+        default="stats",
+        help="the prefix for the generated files, e.g.: PREFIX-size.png for all labels and PREFIX-LABEL-size.png for a specific label"
+    )
+
+    label_key: str = TypedOption(
+        "--label-key",
+        type=str,
+        default="type",
+        help="the key in the meta-data that contains the label"
+    )
+
+    num_bins: int = TypedOption(
+        "--num-bins",
+        type=int,
+        default=50,
+        help="the number of bins per axis of the histograms"
+    )
+
+    max_aspect_ratio: float = TypedOption(
+        "--max-aspect-ratio",
+        type=float,
+        default=8.0,
+        help="the largest aspect ratio (width/height or height/width) covered by the aspect ratio histogram, more extreme boxes get counted in the outermost bins"
+    )
+
+    cell_size: int = TypedOption(
+        "--cell-size",
+        type=int,
+        default=8,
+        help="the size in pixels of a bin in the plots"
+    )
+
+    def _initialize(self):
+        """
+        Initializes the (empty) histograms.
+        """
+        if self.num_bins < 1:
+            raise Exception("Number of bins must be at least 1, received: %d" % self.num_bins)
+        if self.max_aspect_ratio <= 1.0:
+            raise Exception("Maximum aspect ratio must be larger than 1, received: %f" % self.max_aspect_ratio)
+        self._log_aspect = np.log2(self.max_aspect_ratio)
+        self._labels = dict()
+        self._sizes = np.zeros((0, self.num_bins, self.num_bins), dtype=np.int64)
+        self._centers = np.zeros((0, self.num_bins, self.num_bins), dtype=np.int64)
+        self._aspects = np.zeros((0, self.num_bins), dtype=np.int64)
+        self._skipped = 0
+
+    def _label_indices(self, element):
+        """
+        Determines the histogram index of the label of each object, adding
+        new labels as required.
+
+        :param element: the element to get the label indices for
+        :type element: ImageObjectDetectionInstance
+        :return: the array of indices
+        :rtype: np.ndarray
+        """
+        result = np.empty(len(element.annotations), dtype=np.int64)
+        for i, lobj in enumerate(element.annotations):
+            label = str(lobj.metadata.get(self.label_key, "object"))
+            if label not in self._labels:
+                self._labels[label] = len(self._labels)
+            result[i] = self._labels[label]
+        num_labels = len(self._labels)
+        if num_labels > len(self._aspects):
+            grow = num_labels - len(self._aspects)
+            self._sizes = np.concatenate([self._sizes, np.zeros((grow, self.num_bins, self.num_bins), dtype=np.int64)])
+            self._centers = np.concatenate([self._centers, np.zeros((grow, self.num_bins, self.num_bins), dtype=np.int64)])
+            self._aspects = np.concatenate([self._aspects, np.zeros((grow, self.num_bins), dtype=np.int64)])
+        return result
+
+    def _bins(self, values, low, high):
+        """
+        Determines the bin indices of the values, clipping values outside the range.
+
+        :param values: the values to bin
+        :type values: np.ndarray
+        :param low: the lower end of the range
+        :type low: float
+        :param high: the upper end of the range
+        :type high: float
+        :return: the bin indices
+        :rtype: np.ndarray
+        """
+        result = np.floor((values - low) / (high - low) * self.num_bins).astype(np.int64)
+        return np.clip(result, 0, self.num_bins - 1)
+
+    def _count_2d(self, hist, labels, bins_x, bins_y):
+        """
+        Adds the binned values to the stacked 2D histograms.
+
+        :param hist: the histograms to update (label, x, y)
+        :type hist: np.ndarray
+        :param labels: the label indices
+        :type labels: np.ndarray
+        :param bins_x: the bin indices for the x axis
+        :type bins_x: np.ndarray
+        :param bins_y: the bin indices for the y axis
+        :type bins_y: np.ndarray
+        """
+        flat = (labels * self.num_bins + bins_x) * self.num_bins + bins_y
+        hist += np.bincount(flat, minlength=hist.size).reshape(hist.shape)
+
+    @profiled
+    def consume_element(self, element: ImageObjectDetectionInstance):
+        """
+        Consumes instances.
+        """
+        if not hasattr(self, "_labels"):
+            self._initialize()
+
+        if len(element.annotations) == 0:
+            return
+
+        size = element.data.size
+        if size is None:
+            size = Image.open(io.BytesIO(element.data.data)).size
+        width, height = size
+        if (width <= 0) or (height <= 0):
+            self._skipped += 1
+            self.logger.warning("Invalid image size, skipping: %s" % element.data.filename)
+            return
+
+        labels = self._label_indices(element)
+        boxes = np.array([(lobj.x, lobj.y, lobj.width, lobj.height) for lobj in element.annotations], dtype=np.float64)
+        x, y, w, h = boxes[:, 0] / width, boxes[:, 1] / height, boxes[:, 2] / width, boxes[:, 3] / height
+
+        self._count_2d(self._sizes, labels, self._bins(w, 0.0, 1.0), self._bins(h, 0.0, 1.0))
+        self._count_2d(self._centers, labels, self._bins(x + w / 2, 0.0, 1.0), self._bins(y + h / 2, 0.0, 1.0))
+
+        # aspect ratio based on pixels, ignoring degenerate boxes
+        valid = (boxes[:, 2] > 0) & (boxes[:, 3] > 0)
+        if np.any(valid):
+            aspect = np.log2(boxes[valid, 2] / boxes[valid, 3])
+            flat = labels[valid] * self.num_bins + self._bins(aspect, -self._log_aspect, self._log_aspect)
+            self._aspects += np.bincount(flat, minlength=self._aspects.size).reshape(self._aspects.shape)
+
+    def _file_labels(self, labels):
+        """
+        Turns the labels into strings for filenames. Labels that end up the
+        same (e.g., "a/b" and "a_b") get disambiguated with a numeric suffix,
+        with labels that can be used as is taking precedence.
+
+        :param labels: the labels
+        :type labels: list
+        :return: the dictionary of label and string for the filenames
+        :rtype: dict
+        """
+        result = dict()
+        used = set()
+        bases = {x: re.sub(r"[^\w.-]", "_", x) for x in labels}
+        for label in sorted(labels, key=lambda x: (bases[x] != x, x)):
+            base = bases[label]
+            file_label = base
+            suffix = 2
+            while file_label in used:
+                file_label = "%s-%d" % (base, suffix)
+                suffix += 1
+            if suffix > 2:
+                self.logger.warning("Filenames for label '%s' already in use, using: %s" % (label, file_label))
+            used.add(file_label)
+            result[label] = file_label
+        return result
+
+    def _output_file(self, file_label, name, ext):
+        """
+        Generates the output file for the plot of a label.
+
+        :param file_label: the label as used in filenames, None for all labels
+        :type file_label: str
+        :param name: the name of the statistic
+        :type name: str
+        :param ext: the file extension
+        :type ext: str
+        :return: the filename
+        :rtype: str
+        """
+        if file_label is None:
+            return os.path.join(self.output_dir, "%s-%s%s" % (self.prefix, name, ext))
+        return os.path.join(self.output_dir, "%s-%s-%s%s" % (self.prefix, file_label, name, ext))
+
+    def _output_plots(self, label, file_label, sizes, centers, aspects):
+        """
+        Writes the plots for the histograms of a label.
+
+        :param label: the label, None for all labels
+        :type label: str
+        :param file_label: the label as used in filenames, None for all labels
+        :type file_label: str
+        :param sizes: the 2D histogram of the relative widths/heights
+        :type sizes: np.ndarray
+        :param centers: the 2D histogram of the relative center positions
+        :type centers: np.ndarray
+        :param aspects: the histogram of the log2 aspect ratios
+        :type aspects: np.ndarray
+        """
+        name = "all labels" if label is None else label
+        count = int(sizes.sum())
+        heatmap_plot(sizes, self.cell_size, "%s: size (%d objects)" % (name, count), "width", "height", flip_y=True) \
+            .save(self._output_file(file_label, "size", ".png"), format="PNG")
+        heatmap_plot(centers, self.cell_size, "%s: center (%d objects)" % (name, count), "x", "y") \
+            .save(self._output_file(file_label, "center", ".png"), format="PNG")
+        bar_plot(aspects, self.cell_size, self.num_bins * self.cell_size // 2, "%s: aspect ratio (%d objects)" % (name, int(aspects.sum())),
+                 "width/height", "1/%g" % self.max_aspect_ratio, "%g" % self.max_aspect_ratio) \
+            .save(self._output_file(file_label, "aspect", ".png"), format="PNG")
+
+    @profiled_finish
+    def finish(self):
+        if not hasattr(self, "_labels") or (len(self._labels) == 0):
+            print("No statistics generated!")
+            return
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        if self._skipped > 0:
+            self.logger.warning("Skipped %d images with invalid size" % self._skipped)
+        labels = sorted(self._labels.keys())
+        order = [self._labels[x] for x in labels]
+        np.savez_compressed(
+            self._output_file(None, "histograms", ".npz"),
+            labels=np.array(labels), sizes=self._sizes[order], centers=self._centers[order], aspects=self._aspects[order],
+            max_aspect_ratio=self.max_aspect_ratio)
+        self._output_plots(None, None, self._sizes.sum(axis=0), self._centers.sum(axis=0), self._aspects.sum(axis=0))
+        file_labels = self._file_labels(labels)
+        for label in labels:
+            i = self._labels[label]
+            self._output_plots(label, file_labels[label], self._sizes[i], self._centers[i], self._aspects[i])
@@ -0,0 +1 @@
+from ._AnnotationStats import AnnotationStats
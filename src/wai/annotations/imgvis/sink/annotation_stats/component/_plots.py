@@ -0,0 +1,126 @@
+import numpy as np
+
+from PIL import Image, ImageDraw, ImageFont
+
+# the anchor colors of the color map for the counts (dark blue to yellow)
+COLOR_MAP_ANCHORS = np.array([
+    (255, 255, 255),
+    (68, 1, 84),
+    (59, 82, 139),
+    (33, 145, 140),
+    (94, 201, 98),
+    (253, 231, 37),
+], dtype=np.float64)
+
+MARGIN = 30
+
+
+def color_map(values):
+    """
+    Maps the values to colors, zero to white.
+
+    :param values: the array of values between 0 and 1
+    :type values: np.ndarray
+    :return: the array of RGB colors (additional last dimension)
+    :rtype: np.ndarray
+    """
+    positions = np.linspace(0.0, 1.0, len(COLOR_MAP_ANCHORS) - 1)
+    result = np.empty(values.shape + (3,), dtype=np.uint8)
+    for c in range(3):
+        result[..., c] = np.interp(values, positions, COLOR_MAP_ANCHORS[1:, c])
+    result[values <= 0] = COLOR_MAP_ANCHORS[0].astype(np.uint8)
+    return result
+
+
+def _canvas(width, height, title):
+    """
+    Creates the plot canvas with the title at the top.
+
+    :param width: the width of the plot area
+    :type width: int
+    :param height: the height of the plot area
+    :type height: int
+    :param title: the title
+    :type title: str
+    :return: the image, draw context and font
+    :rtype: tuple
+    """
+    img = Image.new("RGB", (width + 2 * MARGIN, height + 2 * MARGIN), (255, 255, 255))
+    draw = ImageDraw.Draw(img)
+    font = ImageFont.load_default()
+    draw.text((MARGIN, 5), title, fill=(0, 0, 0), font=font)
+    draw.rectangle((MARGIN - 1, MARGIN - 1, MARGIN + width, MARGIN + height), outline=(0, 0, 0))
+    return img, draw, font
+
+
+def heatmap_plot(hist, cell_size, title, x_label, y_label, flip_y=False):
+    """
+    Renders the 2D histogram as heatmap, using a logarithmic color scale.
+
+    :param hist: the 2D histogram, first dimension x, second y
+    :type hist: np.ndarray
+    :param cell_size: the size in pixels of a bin
+    :type cell_size: int
+    :param title: the title of the plot
+    :type title: str
+    :param x_label: the label for the x axis (from 0 to 1)
+    :type x_label: str
+    :param y_label: the label for the y axis (from 0 to 1)
+    :type y_label: str
+    :param flip_y: whether the y axis points upwards rather than downwards
+    :type flip_y: bool
+    :return: the plot
+    :rtype: Image.Image
+    """
+    values = np.log1p(hist.T.astype(np.float64))
+    if values.max() > 0:
+        values /= values.max()
+    if flip_y:
+        values = values[::-1]
+    cells = Image.fromarray(color_map(values)).resize((hist.shape[0] * cell_size, hist.shape[1] * cell_size), Image.NEAREST)
+    img, draw, font = _canvas(cells.size[0], cells.size[1], title)
+    img.paste(cells, (MARGIN, MARGIN))
+    bottom = MARGIN + cells.size[1]
+    draw.text((MARGIN, bottom + 5), "0", fill=(0, 0, 0), font=font)
+    draw.text((MARGIN + cells.size[0] // 2, bottom + 5), x_label, fill=(0, 0, 0), font=font)
+    draw.text((MARGIN + cells.size[0] - 5, bottom + 5), "1", fill=(0, 0, 0), font=font)
+    draw.text((5, bottom - 10 if flip_y else MARGIN), "0", fill=(0, 0, 0), font=font)
+    draw.text((5, MARGIN if flip_y else bottom - 10), "1", fill=(0, 0, 0), font=font)
+    draw.text((5, MARGIN + cells.size[1] // 2), y_label, fill=(0, 0, 0), font=font)
+    return img
+
+
+def bar_plot(hist, cell_size, height, title, x_label, x_min, x_max):
+    """
+    Renders the 1D histogram as bar chart.
+
+    :param hist: the 1D histogram
+    :type hist: np.ndarray
+    :param cell_size: the width in pixels of a bin
+    :type cell_size: int
+    :param height: the height in pixels of the plot area
+    :type height: int
+    :param title: the title of the plot
+    :type title: str
+    :param x_label: the label for the x axis
+    :type x_label: str
+    :param x_min: the value at the left of the x axis
+    :type x_min: str
+    :param x_max: the value at the right of the x axis
+    :type x_max: str
+    :return: the plot
+    :rtype: Image.Image
+    """
+    width = len(hist) * cell_size
+    img, draw, font = _canvas(width, height, title)
+    bottom = MARGIN + height
+    peak = hist.max()
+    if peak > 0:
+        for i, count in enumerate(hist.tolist()):
+            if count > 0:
+                x = MARGIN + i * cell_size
+                draw.rectangle((x, bottom - max(1, int(height * count / peak)), x + cell_size - 2, bottom - 1), fill=tuple(COLOR_MAP_ANCHORS[2].astype(int)))
+    draw.text((MARGIN, bottom + 5), x_min, fill=(0, 0, 0), font=font)
+    draw.text((MARGIN + width // 2, bottom + 5), x_label, fill=(0, 0, 0), font=font)
+    draw.text((MARGIN + width - 5 * len(x_max), bottom + 5), x_max, fill=(0, 0, 0), font=font)
+    return img
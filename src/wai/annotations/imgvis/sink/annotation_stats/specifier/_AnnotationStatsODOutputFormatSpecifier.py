@@ -0,0 +1,24 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import Component
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import SinkStageSpecifier
+
+
+class AnnotationStatsODOutputFormatSpecifier(SinkStageSpecifier):
+    """
+    Specifier for to-annotation-stats-od in the object-detection domain.
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Generates plots of the per-label distributions of box size, aspect ratio and center position, using fixed-size histograms."
+
+    @classmethod
+    def components(cls) -> Tuple[Type[Component], ...]:
+        from wai.annotations.imgvis.sink.annotation_stats.component import AnnotationStats
+        return AnnotationStats,
+
+    @classmethod
+    def domain(cls) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.object_detection import ImageObjectDetectionDomainSpecifier
+        return ImageObjectDetectionDomainSpecifier
@@ -0,0 +1 @@
+from ._AnnotationStatsODOutputFormatSpecifier import AnnotationStatsODOutputFormatSpecifier
@@ -0,0 +1,3 @@
+"""
+Package for the image_shards sink.
+"""
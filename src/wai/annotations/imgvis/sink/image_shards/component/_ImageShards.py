@@ -0,0 +1,174 @@
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from wai.common.cli.options import TypedOption
+from wai.annotations.core.component import SinkComponent
+from wai.annotations.domain.image import ImageInstance
+from wai.annotations.imgvis.util import profiled, profiled_finish
+
+ARCHIVE_TAR = "tar"
+ARCHIVE_ZIP = "zip"
+ARCHIVES = [
+    ARCHIVE_TAR,
+    ARCHIVE_ZIP,
+]
+
+INDEX_SUFFIX = "-index.tsv"
+
+
+class ImageShards(
+    SinkComponent[ImageInstance]
+):
+    """
+    Sink for writing images into size-bounded archives (shards), WebDataset-style.
+    The archives get written sequentially by a background thread. An index file
+    maps the filenames to the shard and the offset/size of the (uncompressed) data.
+    """
+
+    output_dir: str = TypedOption(
+        "-o", "--output-dir",
+        type=str,
+        default=".",
+        help="the directory to write the shards and the index to"
+    )
+
+    prefix: str = TypedOption(
+        "--prefix",
+        type=str,
+        default="shard",
+        help="the prefix for the shards (PREFIX-NNNNNN.tar|zip) and the index (PREFIX%s)" % INDEX_SUFFIX
+    )
+
+    archive: str = TypedOption(
+        "--archive",
+        type=str,
+        default=ARCHIVE_TAR,
+        choices=ARCHIVES,
+        help="the type of archive to write, images get stored uncompressed"
+    )
+
+    max_shard_size: int = TypedOption(
+        "--max-shard-size",
+        type=int,
+        default=1024,
+        help="the maximum size of a shard in MB before starting a new one"
+    )
+
+    max_shard_count: int = TypedOption(
+        "--max-shard-count",
+        type=int,
+        default=10000,
+        help="the maximum number of images per shard before starting a new one, <1 for unlimited"
+    )
+
+    queue_size: int = TypedOption(
+        "--queue-size",
+        type=int,
+        default=100,
+        help="the maximum number of images waiting to be written by the background thread"
+    )
+
+    def _initialize(self):
+        """
+        Initializes the writing thread and the index.
+        """
+        if not os.path.exists(self.output_dir):
+            os.makedirs(self.output_dir)
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+        self._shard = None
+        self._shard_index = -1
+        self._shard_name = None
+        self._shard_size = 0
+        self._shard_count = 0
+        self._index = open(os.path.join(self.output_dir, self.prefix + INDEX_SUFFIX), "w")
+        self._index.write("filename\tshard\toffset\tsize\n")
+
+    def _open_shard(self):
+        """
+        Closes the current shard (if any) and starts the next one.
+        """
+        self._close_shard()
+        self._shard_index += 1
+        self._shard_name = "%s-%06d.%s" % (self.prefix, self._shard_index, self.archive)
+        path = os.path.join(self.output_dir, self._shard_name)
+        if self.archive == ARCHIVE_TAR:
+            self._shard = tarfile.open(path, "w")
+        elif self.archive == ARCHIVE_ZIP:
+            self._shard = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_STORED)
+        else:
+            raise Exception("Unhandled archive type: %s" % self.archive)
+        self._shard_size = 0
+        self._shard_count = 0
+
+    def _close_shard(self):
+        """
+        Closes the current shard, if any.
+        """
+        if self._shard is not None:
+            self._shard.close()
+            self._shard = None
+
+    def _write(self, filename, data):
+        """
+        Adds the image to the current shard and records it in the index.
+        Gets executed in the background thread.
+
+        :param filename: the name to store the image under
+        :type filename: str
+        :param data: the image bytes
+        :type data: bytes
+        """
+        if (self._shard is None) \
+                or ((self._shard_count > 0) and (self._shard_size + len(data) > self.max_shard_size * 1024 * 1024)) \
+                or ((self.max_shard_count > 0) and (self._shard_count >= self.max_shard_count)):
+            self._open_shard()
+
+        if self.archive == ARCHIVE_TAR:
+            info = tarfile.TarInfo(filename)
+            info.size = len(data)
+            info.mtime = time.time()
+            self._shard.addfile(info, io.BytesIO(data))
+            # the data gets padded to full blocks
+            blocks, remainder = divmod(len(data), tarfile.BLOCKSIZE)
+            if remainder > 0:
+                blocks += 1
+            offset = self._shard.offset - blocks * tarfile.BLOCKSIZE
+            self._shard_size = self._shard.offset
+        else:
+            self._shard.writestr(filename, data)
+            info = self._shard.infolist()[-1]
+            # local file header: 30 bytes, followed by filename and extra field
+            offset = info.header_offset + 30 + len(info.filename.encode("utf-8")) + len(info.extra)
+            self._shard_size = offset + len(data)
+
+        self._shard_count += 1
+        self._index.write("%s\t%s\t%d\t%d\n" % (filename, self._shard_name, offset, len(data)))
+
+    @profiled
+    def consume_element(self, element: ImageInstance):
+        """
+        Consumes instances by queuing them for writing.
+        """
+        if not hasattr(self, "_executor"):
+            self._initialize()
+
+        self._pending.append(self._executor.submit(self._write, os.path.basename(element.data.filename), element.data.data))
+        # wait for the oldest write, also surfaces any errors
+        while len(self._pending) > max(1, self.queue_size):
+            self._pending.popleft().result()
+
+    @profiled_finish
+    def finish(self):
+        if hasattr(self, "_executor"):
+            while len(self._pending) > 0:
+                self._pending.popleft().result()
+            self._executor.shutdown()
+            self._close_shard()
+            self._index.close()
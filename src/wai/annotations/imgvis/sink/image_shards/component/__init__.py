@@ -0,0 +1 @@
+from ._ImageShards import ImageShards
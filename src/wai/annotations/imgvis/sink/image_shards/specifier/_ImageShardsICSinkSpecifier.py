@@ -0,0 +1,24 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import Component
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import SinkStageSpecifier
+
+
+class ImageShardsICSinkSpecifier(SinkStageSpecifier):
+    """
+    Specifies the image shards sink in the image-classification domain.
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Writes image classification images into size-bounded tar/zip shards, along with an index file."
+
+    @classmethod
+    def domain(cls) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.classification import ImageClassificationDomainSpecifier
+        return ImageClassificationDomainSpecifier
+
+    @classmethod
+    def components(cls) -> Tuple[Type[Component], ...]:
+        from wai.annotations.imgvis.sink.image_shards.component import ImageShards
+        return ImageShards,
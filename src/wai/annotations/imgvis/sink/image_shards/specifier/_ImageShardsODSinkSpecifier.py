@@ -0,0 +1,24 @@
+from typing import Type, Tuple
+
+from wai.annotations.core.component import Component
+from wai.annotations.core.domain import DomainSpecifier
+from wai.annotations.core.specifier import SinkStageSpecifier
+
+
+class ImageShardsODSinkSpecifier(SinkStageSpecifier):
+    """
+    Specifies the image shards sink in the object-detection domain.
+    """
+    @classmethod
+    def description(cls) -> str:
+        return "Writes object detection images into size-bounded tar/zip shards, along with an index file."
+
+    @classmethod
+    def domain(cls) -> Type[DomainSpecifier]:
+        from wai.annotations.domain.image.object_detection import ImageObjectDetectionDomainSpecifier
+        return ImageObjectDetectionDomainSpecifier
+
+    @classmethod
+    def components(cls) -> Tuple[Type[Component], ...]:
+        from wai.annotations.imgvis.sink.image_shards.component import ImageShards
+        return ImageShards,
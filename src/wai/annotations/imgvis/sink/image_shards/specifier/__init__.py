@@ -0,0 +1,3 @@
+from ._ImageShardsICSinkSpecifier import ImageShardsICSinkSpecifier
+from ._ImageShardsISSinkSpecifier import ImageShardsISSinkSpecifier
+from ._ImageShardsODSinkSpecifier import ImageShardsODSinkSpecifier
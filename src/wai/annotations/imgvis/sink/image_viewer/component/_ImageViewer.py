@@ -1,10 +1,18 @@
 import cv2
-import io
 import numpy as np
 
+from collections import deque, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from wai.common.cli.options import TypedOption
 from wai.annotations.core.component import SinkComponent
 from wai.annotations.domain.image import ImageInstance
+from wai.annotations.imgvis.util import profiled, profiled_finish
+
+KEY_PREVIOUS = ord("p")
+KEY_BACK = ord("b")
+KEY_FORWARD = ord("f")
+SKIP = 10
 
 
 class ImageViewer(
@@ -39,21 +47,50 @@ class ImageViewer(
         "--delay",
         type=int,
         default=500,
-        help="the delay in milli-seconds between images, use 0 to wait for keypress, ignored if <0"
+        help="the delay in milli-seconds between images, use 0 to wait for keypress, ignored if <0; "
+             "when waiting for keypress, use 'p' for the previous image, 'b'/'f' to skip %d images back/forward and any other key for the next image" % SKIP
     )
 
-    def consume_element(self, element: ImageInstance):
+    prefetch: int = TypedOption(
+        "--prefetch",
+        type=int,
+        default=2,
+        help="the number of upcoming images to decode and resize in the background while the current one is displayed, 0 to turn off"
+    )
+
+    cache_size: int = TypedOption(
+        "--cache-size",
+        type=int,
+        default=100,
+        help="the number of already displayed (resized) images to keep for navigating back"
+    )
+
+    def _initialize(self):
         """
-        Consumes instances by displaying them.
+        Initializes the decoding thread, the frame cache etc.
+        """
+        self._width, self._height = [int(x) for x in self.size.split(",")]
+        self._ratio = self._width / self._height
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+        self._frames = OrderedDict()
+        self._num_frames = 0
+        self._skip = 0
+
+    def _prepare(self, data):
+        """
+        Decodes the image and resizes it, if necessary. Gets executed in the background thread.
+
+        :param data: the image bytes
+        :type data: bytes
+        :return: the image to display
+        :rtype: np.ndarray
         """
         # read image
-        img_array = np.fromstring(io.BytesIO(element.data.data).read(), dtype=np.uint8)
+        img_array = np.frombuffer(data, dtype=np.uint8)
         img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
 
         # resize image, if necessary
-        if not hasattr(self, "_width"):
-            self._width, self._height = [int(x) for x in self.size.split(",")]
-            self._ratio = self._width / self._height
         h, w, _ = img.shape
         if (h > self._height) or (w > self._width):
             img_ratio = w / h
@@ -65,6 +102,15 @@ class ImageViewer(
                 w_new = h_new * img_ratio
             img = cv2.resize(img, (int(w_new), int(h_new)))
 
+        return img
+
+    def _display(self, img):
+        """
+        Displays the image.
+
+        :param img: the image to display
+        :type img: np.ndarray
+        """
         cv2.imshow(self.title, img)
 
         # position window
@@ -72,9 +118,78 @@ class ImageViewer(
             self._x, self._y = [int(x) for x in self.position.split(",")]
             cv2.moveWindow(self.title, self._x, self._y)
 
-        # delay
-        if self.delay >= 0:
-            cv2.waitKey(self.delay)
+    def _navigate(self, index):
+        """
+        Displays the frame and, if waiting for keypress, lets the user navigate
+        through the cached frames until the next frame from the stream is required.
+
+        :param index: the index of the frame to display
+        :type index: int
+        """
+        while True:
+            self._frames.move_to_end(index)
+            self._display(self._frames[index])
+
+            # delay
+            if self.delay > 0:
+                cv2.waitKey(self.delay)
+            if self.delay != 0:
+                return
+
+            key = cv2.waitKey(0) & 0xFF
+            if key == KEY_PREVIOUS:
+                target = index - 1
+            elif key == KEY_BACK:
+                target = index - SKIP
+            elif key == KEY_FORWARD:
+                target = index + SKIP
+            else:
+                target = index + 1
+
+            # beyond the last frame? continue with the stream
+            last = self._num_frames - 1
+            if target > last:
+                self._skip = target - last - 1
+                return
+
+            # frame no longer cached? use the closest one that is
+            if target not in self._frames:
+                target = min(self._frames.keys(), key=lambda x: abs(x - target))
+            index = max(0, target)
+
+    def _show_next(self):
+        """
+        Displays the next frame from the stream once it has been prepared.
+        """
+        img = self._pending.popleft().result()
+        index = self._num_frames
+        self._num_frames += 1
+        self._frames[index] = img
+        while len(self._frames) > max(1, self.cache_size):
+            self._frames.popitem(last=False)
+
+        if self._skip > 0:
+            self._skip -= 1
+            return
+
+        self._navigate(index)
+
+    @profiled
+    def consume_element(self, element: ImageInstance):
+        """
+        Consumes instances by displaying them.
+        """
+        if not hasattr(self, "_width"):
+            self._initialize()
+
+        self._pending.append(self._executor.submit(self._prepare, element.data.data))
+        if len(self._pending) > max(0, self.prefetch):
+            self._show_next()
 
+    @profiled_finish
     def finish(self):
+        if hasattr(self, "_width"):
+            while len(self._pending) > 0:
+                self._show_next()
+            self._executor.shutdown()
         cv2.destroyAllWindows()
@@ -0,0 +1,4 @@
+from ._checkpoint import Checkpoint
+from ._matching import find_matches
+from ._polygons import object_vertices, scale_polygon
+from ._profiling import profiled, profiled_finish
@@ -0,0 +1,62 @@
+import os
+import pickle
+import time
+
+
+class Checkpoint(object):
+    """
+    Periodically saves the state of a long-running component to a local file,
+    so that the processing can be resumed after the job got killed. The file
+    gets replaced atomically, i.e., a crash while saving leaves the previous
+    checkpoint intact.
+    """
+
+    def __init__(self, path, interval):
+        """
+        Initializes the checkpoint.
+
+        :param path: the file to save the state to
+        :type path: str
+        :param interval: the minimum number of seconds between saves
+        :type interval: float
+        """
+        self.path = path
+        self.interval = interval
+        self._last = time.time()
+
+    def due(self):
+        """
+        Returns whether the next save is due.
+
+        :return: True if due
+        :rtype: bool
+        """
+        return time.time() - self._last >= self.interval
+
+    def save(self, state):
+        """
+        Saves the state.
+
+        :param state: the state to save, must be picklable
+        :type state: dict
+        """
+        dirname = os.path.dirname(self.path)
+        if (len(dirname) > 0) and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as fp:
+            pickle.dump(state, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self._last = time.time()
+
+    def load(self):
+        """
+        Loads the state, if a checkpoint is available.
+
+        :return: the state, None if no checkpoint
+        :rtype: dict
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, "rb") as fp:
+            return pickle.load(fp)
@@ -0,0 +1,43 @@
+from wai.annotations.core.util import intersect_over_union
+
+
+def find_matches(polygons_old, polygons_new, min_iou):
+    """
+    Finds the matches between the old and new annotations, i.e., all the
+    pairs of polygons that have an IoU (intersect over union) of at least
+    the specified minimum.
+
+    :param polygons_old: the old annotations, prepared geometries
+    :type polygons_old: list
+    :param polygons_new: the new annotations
+    :type polygons_new: list
+    :param min_iou: the minimum IoU for a match
+    :type min_iou: float
+    :return: the matches, list of old/new index/IoU tuples (an index of -1 means no match found)
+    :rtype: list
+    """
+    result = []
+    match_new = set([x for x in range(len(polygons_new))])
+    match_old = set([x for x in range(len(polygons_old))])
+    for n, poly_new in enumerate(polygons_new):
+        for o, poly_old in enumerate(polygons_old):
+            if not poly_old.intersects(poly_new):
+                continue
+            iou = intersect_over_union(poly_new, poly_old.context)
+            if iou > 0:
+                if iou >= min_iou:
+                    if n in match_new:
+                        match_new.remove(n)
+                    if o in match_old:
+                        match_old.remove(o)
+                    result.append((o, n, iou))
+
+    # add old polygons that had no match
+    for o in match_old:
+        result.append((o, -1, 0.0))
+
+    # add new polygons that had no match
+    for n in match_new:
+        result.append((-1, n, 0.0))
+
+    return result
@@ -0,0 +1,82 @@
+import numpy as np
+
+from wai.common.adams.imaging.locateobjects import constants
+
+
+def scale_polygon(poly_x, poly_y, scale_x=1.0, scale_y=1.0, tolerance=0.0):
+    """
+    Scales the polygon and, if a tolerance is provided, simplifies it by
+    merging consecutive vertices that fall into the same cell of a grid with
+    the tolerance as cell size (i.e., in output pixels). Objects that collapse
+    to less than three vertices get represented by their bounding box.
+
+    :param poly_x: the x coordinates of the polygon
+    :type poly_x: list
+    :param poly_y: the y coordinates of the polygon
+    :type poly_y: list
+    :param scale_x: the factor to scale the x coordinates with
+    :type scale_x: float
+    :param scale_y: the factor to scale the y coordinates with
+    :type scale_y: float
+    :param tolerance: the grid cell size in output pixels, <=0 for no simplification
+    :type tolerance: float
+    :return: the scaled (and simplified) points as (N, 2) array
+    :rtype: np.ndarray
+    """
+    points = np.empty((len(poly_x), 2), dtype=np.float64)
+    points[:, 0] = poly_x
+    points[:, 1] = poly_y
+    if (scale_x != 1.0) or (scale_y != 1.0):
+        points *= (scale_x, scale_y)
+    if (tolerance <= 0) or (len(points) <= 4):
+        return points
+
+    # keep the first vertex of each run of vertices within the same cell
+    cells = np.floor(points / tolerance).astype(np.int64)
+    keep = np.empty(len(points), dtype=bool)
+    keep[0] = True
+    keep[1:] = np.any(cells[1:] != cells[:-1], axis=1)
+    # polygon is closed, i.e., last vertex is adjacent to the first one
+    if np.all(cells[-1] == cells[0]):
+        keep[-1] = False
+    if np.count_nonzero(keep) >= 3:
+        return points[keep]
+
+    # too small to retain its shape, use the bounding box
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return np.array([(x0, y0), (x1, y0), (x1, y1), (x0, y1)], dtype=np.float64)
+
+
+def object_vertices(located_objects):
+    """
+    Collects the vertices of all the objects in a single buffer: the polygon
+    (coordinates rounded like LocatedObject.get_polygon_x/y) if available,
+    otherwise the corners of the bounding box.
+
+    :param located_objects: the objects to get the vertices from
+    :type located_objects: LocatedObjects
+    :return: the tuple of (N, 2) vertex array and the offsets of the objects in it (one more than objects)
+    :rtype: tuple
+    """
+    all_x = []
+    all_y = []
+    offsets = [0]
+    for lobj in located_objects:
+        if lobj.has_polygon():
+            poly_x = lobj.metadata[constants.KEY_POLY_X].split(",")
+            poly_y = lobj.metadata[constants.KEY_POLY_Y].split(",")
+            n = min(len(poly_x), len(poly_y))
+            all_x.extend(poly_x[:n])
+            all_y.extend(poly_y[:n])
+        else:
+            rect = lobj.get_rectangle()
+            all_x.extend((rect.left(), rect.right(), rect.right(), rect.left()))
+            all_y.extend((rect.top(), rect.top(), rect.bottom(), rect.bottom()))
+        offsets.append(len(all_x))
+
+    # parses the polygon strings as well
+    vertices = np.empty((len(all_x), 2), dtype=np.float64)
+    vertices[:, 0] = all_x
+    vertices[:, 1] = all_y
+    return np.round(vertices, out=vertices), np.array(offsets, dtype=np.int64)
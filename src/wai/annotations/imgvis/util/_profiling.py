@@ -0,0 +1,193 @@
+import atexit
+import cProfile
+import functools
+import os
+import pstats
+
+PROFILE_ENV = "WAI_IMGVIS_PROFILE"
+PROFILE_EVERY_ENV = "WAI_IMGVIS_PROFILE_EVERY"
+DEFAULT_PROFILE_EVERY = 100
+
+# the limits for walking the call graph when generating the folded stacks
+MAX_STACK_DEPTH = 100
+MAX_STACK_VISITS = 1000000
+
+
+class _Profiler(object):
+    """
+    Collects the profiles of the sampled calls and writes them out once the
+    components have finished (or at exit).
+    """
+
+    def __init__(self, prefix, every):
+        """
+        Initializes the profiler.
+
+        :param prefix: the path prefix for the output files (.pstats and .folded)
+        :type prefix: str
+        :param every: the sampling interval, i.e., every n-th call gets profiled
+        :type every: int
+        """
+        self.prefix = prefix
+        self.every = max(1, every)
+        self.profile = cProfile.Profile()
+        self.active = False
+        self.num_samples = 0
+        self.num_written = 0
+
+    def wrap(self, func):
+        """
+        Wraps the function, profiling every n-th call.
+
+        :param func: the function to wrap
+        :return: the wrapped function
+        """
+        count = [0]
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            count[0] += 1
+            # the stream calls the downstream components from within, those just get included
+            if self.active or ((count[0] - 1) % self.every != 0):
+                return func(*args, **kwargs)
+            self.active = True
+            self.num_samples += 1
+            self.profile.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.profile.disable()
+                self.active = False
+
+        return wrapper
+
+    def write(self):
+        """
+        Writes the aggregated statistics (pstats) and the folded stacks for flame graphs.
+        Does nothing if there are no new samples since the last time.
+        """
+        if self.num_samples == self.num_written:
+            return
+        self.num_written = self.num_samples
+        dirname = os.path.dirname(self.prefix)
+        if (len(dirname) > 0) and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        stats = pstats.Stats(self.profile)
+        stats.dump_stats(self.prefix + ".pstats")
+        with open(self.prefix + ".folded", "w") as fp:
+            for stack, micros in sorted(folded_stacks(stats).items()):
+                fp.write("%s %d\n" % (stack, micros))
+
+
+def _label(func):
+    """
+    Generates the label of a function for the stacks.
+
+    :param func: the (filename, line, name) tuple
+    :type func: tuple
+    :return: the label
+    :rtype: str
+    """
+    filename, line, name = func
+    if filename == "~":
+        return name
+    return "%s:%d:%s" % (os.path.basename(filename), line, name)
+
+
+def folded_stacks(stats, max_depth=MAX_STACK_DEPTH, max_visits=MAX_STACK_VISITS):
+    """
+    Turns the statistics into folded stacks (as used by flamegraph.pl, speedscope, etc).
+    Since cProfile only records caller/callee pairs, the time of a function gets
+    distributed over its callers proportionally. As the number of caller paths can
+    grow exponentially, stacks are limited in depth, the number of visited calls is
+    limited and calls of less than a microsecond don't get followed.
+
+    :param stats: the statistics to convert
+    :type stats: pstats.Stats
+    :param max_depth: the maximum depth of the stacks
+    :type max_depth: int
+    :param max_visits: the maximum number of calls to visit
+    :type max_visits: int
+    :return: the dictionary of stack (semicolon-separated) and time in microseconds
+    :rtype: dict
+    """
+    callees = dict()
+    roots = []
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        if len(callers) == 0:
+            roots.append(func)
+        for caller, edge in callers.items():
+            # edge: (cc, nc, tt, ct) of the func when called from caller
+            callees.setdefault(caller, []).append((func, edge[3]))
+
+    result = dict()
+    visits = [0]
+
+    def visit(func, budget, path):
+        tt, ct = stats.stats[func][2], stats.stats[func][3]
+        if (ct <= 0) or (budget < 1e-6) or (len(path) >= max_depth) or (visits[0] >= max_visits):
+            return
+        visits[0] += 1
+        fraction = min(1.0, budget / ct)
+        path = path + [func]
+        stack = ";".join(_label(x) for x in path)
+        micros = int(tt * fraction * 1000000)
+        if micros > 0:
+            result[stack] = result.get(stack, 0) + micros
+        for callee, edge_ct in callees.get(func, []):
+            if callee not in path:
+                visit(callee, edge_ct * fraction, path)
+
+    for root in roots:
+        # disabling the profiler gets recorded as well
+        if "_lsprof.Profiler" in root[2]:
+            continue
+        visit(root, stats.stats[root][3], [])
+
+    return result
+
+
+_profiler = None
+if len(os.environ.get(PROFILE_ENV, "")) > 0:
+    _profiler = _Profiler(os.environ[PROFILE_ENV], int(os.environ.get(PROFILE_EVERY_ENV, DEFAULT_PROFILE_EVERY)))
+    # fallback for components that don't get finished
+    atexit.register(_profiler.write)
+
+
+def profiled(func):
+    """
+    Decorator for profiling the processing of elements, enabled by setting the
+    WAI_IMGVIS_PROFILE environment variable to the path prefix for the output files.
+    Only every n-th call gets profiled (WAI_IMGVIS_PROFILE_EVERY, default: 100).
+    Once the component has finished (see profiled_finish) or at exit, the aggregated
+    statistics get written to PREFIX.pstats and the folded stacks for flame graphs
+    to PREFIX.folded. When disabled, the function gets returned as is.
+
+    :param func: the function to profile
+    :return: the (wrapped) function
+    """
+    if _profiler is None:
+        return func
+    return _profiler.wrap(func)
+
+
+def profiled_finish(func):
+    """
+    Decorator for the finish method of components with profiled elements,
+    writing the profiling output once the component has finished.
+    When profiling is disabled, the function gets returned as is.
+
+    :param func: the finish method to decorate
+    :return: the (wrapped) function
+    """
+    if _profiler is None:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _profiler.write()
+
+    return wrapper